@@ -1,3 +1,6 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,6 +9,7 @@ from passlib.hash import bcrypt
 import os
 from dotenv import load_dotenv
 from config import config
+from models import UserResponse
 
 load_dotenv()
 
@@ -25,6 +29,80 @@ def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashing jobs are already waiting"""
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification off the event loop.
+
+    Jobs go to a bounded thread or process pool. Once ``max_pending`` jobs are
+    queued or running, new ones are rejected with PasswordHasherBusy instead of
+    piling up behind a login storm.
+    """
+    
+    def __init__(self, workers: int, max_pending: int, use_processes: bool = False):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+    
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            pool_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._executor = pool_class(max_workers=self.workers)
+        return self._executor
+    
+    async def _run(self, func, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - started
+    
+    async def hash(self, password: str) -> str:
+        """Hash a password in the pool"""
+        return await self._run(get_password_hash, password)
+    
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against its hash in the pool"""
+        return await self._run(verify_password, plain_password, hashed_password)
+    
+    def stats(self) -> dict:
+        """Queue depth and timing counters for monitoring"""
+        return {
+            "executor": "process" if self.use_processes else "thread",
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_seconds * 1000 / self.completed, 2) if self.completed else 0.0,
+        }
+    
+    def shutdown(self):
+        """Stop the worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_hasher = PasswordHasher(
+    workers=config.PASSWORD_HASH_WORKERS,
+    max_pending=config.PASSWORD_HASH_MAX_PENDING,
+    use_processes=config.PASSWORD_HASH_EXECUTOR == "process"
+)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -37,6 +115,21 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def user_claims(user: dict) -> dict:
+    """Extract the public user fields that can be carried inside a token"""
+    claims = {}
+    for field in UserResponse.model_fields:
+        value = user.get(field)
+        claims[field] = value.isoformat() if isinstance(value, datetime) else value
+    return claims
+
+def create_user_access_token(user: dict) -> str:
+    """Create an access token for a user, embedding its claims in claims-only mode"""
+    data = {"sub": user["id"]}
+    if config.AUTH_CLAIMS_ONLY:
+        data["usr"] = user_claims(user)
+    return create_access_token(data=data)
+
 def verify_token(token: str) -> Optional[dict]:
     """Verify a JWT token and return its payload"""
     try:
@@ -0,0 +1,177 @@
+"""
+Materialized-path storage for comment threads.
+
+Every comment stores ``ancestors``, the ids of all its ancestors from the
+thread root down to its parent, next to ``root_id`` and ``depth``. With a
+multikey index on ``ancestors`` a whole subtree is one indexed range, so
+reading and deleting a thread take a constant number of queries
+however deep or wide it is.
+
+Polls keep a denormalized ``comments_count`` that is adjusted with a direct
+``$inc`` on every create and delete. As a safety net,
+``reconcile_comment_counts`` repairs any drift in bulk, on one worker at a
+time.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from pymongo import UpdateOne
+
+from job_lock import acquire_lease
+from pagination import CURSOR_SORT_ASC
+
+logger = logging.getLogger(__name__)
+
+# Fields needed from a parent to derive its children's path
+PATH_PROJECTION = {"_id": 0, "id": 1, "ancestors": 1, "root_id": 1, "depth": 1}
+
+
+def child_path(parent: Optional[dict]) -> dict:
+    """Path fields (ancestors, root_id, depth) for a reply to ``parent``"""
+    if not parent:
+        return {"ancestors": [], "root_id": None, "depth": 0}
+    ancestors = list(parent.get("ancestors") or []) + [parent["id"]]
+    return {"ancestors": ancestors, "root_id": ancestors[0], "depth": len(ancestors)}
+
+
+def subtree_filter(comment_id: str, include_root: bool = True) -> dict:
+    """Query matching every descendant of a comment, and the comment itself"""
+    if include_root:
+        return {"$or": [{"id": comment_id}, {"ancestors": comment_id}]}
+    return {"ancestors": comment_id}
+
+
+async def adjust_reply_count(db, parent_id: str, delta: int) -> None:
+    """Change a comment's stored direct reply count by ``delta``.
+
+    Comments from before reply_count was stored get their replies counted
+    instead, so the first change does not turn a missing field into 1 or -1.
+    """
+    result = await db.comments.update_one(
+        {"id": parent_id, "reply_count": {"$exists": True}},
+        {"$inc": {"reply_count": delta}}
+    )
+    if not result.matched_count:
+        count = await db.comments.count_documents({"parent_comment_id": parent_id})
+        # $max: when two first changes race, the later (larger) count wins
+        await db.comments.update_one({"id": parent_id}, {"$max": {"reply_count": count}})
+
+
+def has_path(comment: dict) -> bool:
+    """Whether a comment stores its ancestors (created or migrated after paths existed)"""
+    return "ancestors" in comment
+
+
+async def _walk_replies(db, root_id: str, max_depth: Optional[int], limit: Optional[int],
+                        projection: Optional[dict] = None) -> List[dict]:
+    """Descendants found level by level through parent_comment_id.
+
+    Fallback for comments from before ``ancestors`` was stored: one ``$in``
+    query per level instead of one range query for the whole subtree.
+    """
+    found: List[dict] = []
+    parent_ids = [root_id]
+    depth = 0
+    while parent_ids and (limit is None or len(found) < limit) and (max_depth is None or depth < max_depth):
+        remaining = None if limit is None else limit - len(found)
+        level = await db.comments.find(
+            {"parent_comment_id": {"$in": parent_ids}}, projection
+        ).limit(remaining or 0).to_list(remaining)
+        found.extend(level)
+        parent_ids = [comment["id"] for comment in level]
+        depth += 1
+    return found
+
+
+async def load_subtree(db, root: dict, max_depth: Optional[int] = None, limit: int = 1000) -> List[dict]:
+    """Descendants of the ``root`` comment document, oldest first.
+
+    ``max_depth`` is relative to the comment: 1 returns direct replies only.
+    Comments with a stored path take one query; older ones are walked level
+    by level.
+    """
+    if not has_path(root):
+        descendants = await _walk_replies(db, root["id"], max_depth, limit)
+        return sorted(descendants, key=lambda comment: (comment["created_at"], comment["id"]))
+    query = subtree_filter(root["id"], include_root=False)
+    if max_depth is not None:
+        query["depth"] = {"$lte": root.get("depth", 0) + max_depth}
+    return await db.comments.find(query).sort(CURSOR_SORT_ASC).limit(limit).to_list(limit)
+
+
+async def delete_subtree(db, root: dict) -> List[str]:
+    """Delete the ``root`` comment document, all of its replies and their likes.
+
+    Returns the ids of the deleted comments. The cost is one read of the
+    subtree ids (one per level for comments without a stored path) plus one
+    ``delete_many`` per collection.
+    """
+    if has_path(root):
+        descendants = await db.comments.find(
+            subtree_filter(root["id"], include_root=False), {"id": 1}
+        ).to_list(None)
+    else:
+        descendants = await _walk_replies(db, root["id"], None, None, {"id": 1})
+    comment_ids = [root["id"]] + [comment["id"] for comment in descendants]
+    await db.comment_likes.delete_many({"comment_id": {"$in": comment_ids}})
+    await db.comments.delete_many({"id": {"$in": comment_ids}})
+    return comment_ids
+
+
+async def reconcile_comment_counts(db, batch_size: int = 1000, grace_seconds: float = 60) -> int:
+    """Reset every poll's comments_count to its real number of comments.
+
+    A safety net: create and delete keep the count current with a direct
+    ``$inc``. Counts come from a single ``$group`` over comments, and each fix
+    is a compare-and-set on the value that was read. A comment written between
+    the ``$group`` and the poll read could still make a fix off by one, so
+    polls that received a comment in the last ``grace_seconds`` are skipped.
+    Any remaining drift is repaired on the next pass. Returns the number of
+    polls repaired.
+    """
+    recent = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    actual = {}
+    async for row in db.comments.aggregate([
+        {"$group": {"_id": "$poll_id", "count": {"$sum": 1}, "latest": {"$max": "$created_at"}}}
+    ]):
+        actual[row["_id"]] = row
+
+    repaired = 0
+    operations = []
+    async for poll in db.polls.find({}, {"_id": 0, "id": 1, "comments_count": 1}):
+        stored = poll.get("comments_count")
+        row = actual.get(poll["id"])
+        if row and row["latest"] and row["latest"] > recent:
+            continue
+        expected = row["count"] if row else 0
+        if stored != expected:
+            operations.append(UpdateOne(
+                {"id": poll["id"], "comments_count": stored},
+                {"$set": {"comments_count": expected}},
+            ))
+        if len(operations) >= batch_size:
+            repaired += (await db.polls.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        repaired += (await db.polls.bulk_write(operations, ordered=False)).modified_count
+    return repaired
+
+
+async def run_reconciler(db, interval: float) -> None:
+    """Reconcile comment counts every ``interval`` seconds until cancelled.
+
+    Every worker runs this loop, but only the holder of the
+    ``comment_count_reconciler`` lease does the work on each pass.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await acquire_lease(db, "comment_count_reconciler", ttl=2 * interval):
+                continue
+            repaired = await reconcile_comment_counts(db)
+            if repaired:
+                logger.info(f"Repaired comments_count on {repaired} polls")
+        except Exception as e:
+            logger.error(f"Comment count reconciliation failed: {e}")
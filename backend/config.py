@@ -15,11 +15,27 @@ class Config:
     # Database Configuration
     MONGO_URL: str = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     DB_NAME: str = os.getenv("DB_NAME", "social_media_app")
+    ENSURE_INDEXES_ON_STARTUP: bool = os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true"
+    LOGIN_ATTEMPT_TTL_DAYS: int = int(os.getenv("LOGIN_ATTEMPT_TTL_DAYS", "90"))
     
     # Security Configuration
     SECRET_KEY: str = os.getenv("SECRET_KEY", "fallback-secret-key-for-development-only")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
+    # Embed the public user fields in the JWT so get_current_user can skip the
+    # database entirely. Profile changes only show up after the next login.
+    AUTH_CLAIMS_ONLY: bool = os.getenv("AUTH_CLAIMS_ONLY", "false").lower() == "true"
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    USER_CACHE_TTL_SECONDS: int = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+    # Users allowed to read /api/system/* diagnostics (comma-separated emails)
+    ADMIN_EMAILS: List[str] = [
+        email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()
+    ]
+    
+    # Password hashing pool ("thread" or "process")
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
     
     # Server Configuration
     BACKEND_HOST: str = os.getenv("BACKEND_HOST", "0.0.0.0")
@@ -82,6 +98,58 @@ class Config:
     DEFAULT_PAGE_SIZE = 20
     MAX_PAGE_SIZE = 100
     
+    # Home timeline (fan-out-on-write) configuration
+    TIMELINE_MAX_ENTRIES: int = int(os.getenv("TIMELINE_MAX_ENTRIES", "800"))
+    TIMELINE_CELEBRITY_THRESHOLD: int = int(os.getenv("TIMELINE_CELEBRITY_THRESHOLD", "10000"))
+    TIMELINE_FANOUT_BATCH_SIZE: int = int(os.getenv("TIMELINE_FANOUT_BATCH_SIZE", "1000"))
+    TIMELINE_TRIM_INTERVAL_SECONDS: int = int(os.getenv("TIMELINE_TRIM_INTERVAL_SECONDS", "3600"))
+    # Newest polls of a newly followed author copied into the reader's timeline
+    TIMELINE_FOLLOW_BACKFILL: int = int(os.getenv("TIMELINE_FOLLOW_BACKFILL", "50"))
+    
+    # Ranked feed configuration
+    RANKING_CANDIDATE_LIMIT: int = int(os.getenv("RANKING_CANDIDATE_LIMIT", "2000"))
+    RANKING_CANDIDATE_DAYS: int = int(os.getenv("RANKING_CANDIDATE_DAYS", "14"))
+    RANKING_CACHE_TTL_SECONDS: int = int(os.getenv("RANKING_CACHE_TTL_SECONDS", "60"))
+    RANKING_HALF_LIFE_HOURS: float = float(os.getenv("RANKING_HALF_LIFE_HOURS", "24"))
+    RANKING_GRAVITY: float = float(os.getenv("RANKING_GRAVITY", "1.5"))
+    
+    # Write-behind counters for likes, shares and votes
+    COUNTER_BUFFER_ENABLED: bool = os.getenv("COUNTER_BUFFER_ENABLED", "true").lower() == "true"
+    COUNTER_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("COUNTER_FLUSH_INTERVAL_SECONDS", "1.0"))
+    COUNTER_FLUSH_THRESHOLD: int = int(os.getenv("COUNTER_FLUSH_THRESHOLD", "500"))
+    
+    # Comment threads returned by GET /api/comments/{id}
+    COMMENT_REPLY_DEPTH: int = int(os.getenv("COMMENT_REPLY_DEPTH", "1"))
+    COMMENT_MAX_REPLY_DEPTH: int = int(os.getenv("COMMENT_MAX_REPLY_DEPTH", "10"))
+    COMMENT_MAX_REPLIES: int = int(os.getenv("COMMENT_MAX_REPLIES", "500"))
+    # Replies loaded per node by the paginated comment tree endpoints
+    COMMENT_TREE_MAX_REPLIES_PER_NODE: int = int(os.getenv("COMMENT_TREE_MAX_REPLIES_PER_NODE", "20"))
+    # Seconds between comments_count repairs (0 disables the reconciler)
+    COMMENT_COUNT_RECONCILE_INTERVAL_SECONDS: int = int(os.getenv("COMMENT_COUNT_RECONCILE_INTERVAL_SECONDS", "3600"))
+    
+    # Real-time events over WebSockets ("memory" or "redis")
+    PUBSUB_BACKEND: str = os.getenv("PUBSUB_BACKEND", "memory")
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    WEBSOCKET_QUEUE_SIZE: int = int(os.getenv("WEBSOCKET_QUEUE_SIZE", "100"))
+    # Bound on how stale another worker's cached unread badge can be
+    UNREAD_CACHE_TTL_SECONDS: int = int(os.getenv("UNREAD_CACHE_TTL_SECONDS", "30"))
+    
+    # Follow graph caches and list pages
+    FOLLOW_GRAPH_CACHE_TTL_SECONDS: int = int(os.getenv("FOLLOW_GRAPH_CACHE_TTL_SECONDS", "300"))
+    FOLLOW_GRAPH_MAX_CACHED_SET: int = int(os.getenv("FOLLOW_GRAPH_MAX_CACHED_SET", "5000"))
+    FOLLOW_LIST_MAX_PAGE_SIZE: int = int(os.getenv("FOLLOW_LIST_MAX_PAGE_SIZE", "1000"))
+    FOLLOW_STATUS_BATCH_MAX_IDS: int = int(os.getenv("FOLLOW_STATUS_BATCH_MAX_IDS", "500"))
+    
+    # Follow suggestions job
+    SUGGESTIONS_TOP_K: int = int(os.getenv("SUGGESTIONS_TOP_K", "50"))
+    SUGGESTIONS_MAX_AGE_SECONDS: int = int(os.getenv("SUGGESTIONS_MAX_AGE_SECONDS", "86400"))
+    # Seconds between job passes (0 disables the job)
+    SUGGESTIONS_JOB_INTERVAL_SECONDS: int = int(os.getenv("SUGGESTIONS_JOB_INTERVAL_SECONDS", "3600"))
+    SUGGESTIONS_BATCH_SIZE: int = int(os.getenv("SUGGESTIONS_BATCH_SIZE", "500"))
+    SUGGESTIONS_MAX_POLL_VOTERS: int = int(os.getenv("SUGGESTIONS_MAX_POLL_VOTERS", "5000"))
+    SUGGESTIONS_FOF_WEIGHT: float = float(os.getenv("SUGGESTIONS_FOF_WEIGHT", "1.0"))
+    SUGGESTIONS_COVOTE_WEIGHT: float = float(os.getenv("SUGGESTIONS_COVOTE_WEIGHT", "0.5"))
+    
     # Social features defaults
     MAX_COMMENT_LENGTH = 500
     MAX_POLL_OPTIONS = 4
@@ -0,0 +1,249 @@
+"""
+Write-behind counter aggregation.
+
+Hot documents (popular polls and comments) receive a ``$inc`` for every like,
+share and vote, which serializes writers on a single document. The
+CounterBuffer coalesces those increments in memory, sharded by document, and
+flushes them with one ``bulk_write`` per collection on an interval or once
+enough documents are dirty. Readers merge the pending deltas into the
+documents they load, so clients still see up-to-date numbers.
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Prefix for per-option vote deltas on polls, e.g. "option:<option_id>"
+OPTION_VOTES_PREFIX = "option:"
+
+
+def option_votes_field(option_id: str) -> str:
+    """Counter field name for the votes of one poll option"""
+    return f"{OPTION_VOTES_PREFIX}{option_id}"
+
+
+class CounterBuffer:
+    """Sharded in-memory buffer of pending counter increments"""
+
+    def __init__(self, db, enabled: bool = True, shards: int = 16,
+                 flush_interval: float = 1.0, flush_threshold: int = 500):
+        self.db = db
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._shards: List[Dict[Tuple[str, str], Dict[str, int]]] = [{} for _ in range(shards)]
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_updates = 0
+
+    def _shard(self, key: Tuple[str, str]) -> Dict[Tuple[str, str], Dict[str, int]]:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _add(self, collection: str, doc_id: str, deltas: Dict[str, int]) -> None:
+        key = (collection, doc_id)
+        pending = self._shard(key).setdefault(key, {})
+        for field, delta in deltas.items():
+            pending[field] = pending.get(field, 0) + delta
+
+    def increment(self, collection: str, doc_id: str, deltas: Dict[str, int]) -> None:
+        """Queue increments for one document"""
+        self._add(collection, doc_id, deltas)
+        if self.dirty_count() >= self.flush_threshold and not self._flushing:
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    def pending(self, collection: str, doc_id: str) -> Dict[str, int]:
+        """Deltas not yet written for one document"""
+        key = (collection, doc_id)
+        return self._shard(key).get(key, {})
+
+    def merge(self, collection: str, doc: dict) -> dict:
+        """Return a copy of ``doc`` with its pending deltas applied"""
+        deltas = self.pending(collection, doc["id"])
+        if not deltas:
+            return doc
+        merged = dict(doc)
+        for field, delta in deltas.items():
+            if field.startswith(OPTION_VOTES_PREFIX):
+                option_id = field[len(OPTION_VOTES_PREFIX):]
+                merged["options"] = [
+                    {**option, "votes": option.get("votes", 0) + delta} if option["id"] == option_id else option
+                    for option in merged.get("options", [])
+                ]
+            else:
+                merged[field] = merged.get(field, 0) + delta
+        return merged
+
+    def dirty_count(self) -> int:
+        """Number of documents with pending deltas"""
+        return sum(len(shard) for shard in self._shards)
+
+    async def apply(self, collection: str, doc_id: str, deltas: Dict[str, int]) -> None:
+        """Buffer increments, or write them straight away when buffering is disabled"""
+        if self.enabled:
+            self.increment(collection, doc_id, deltas)
+            return
+        inc, array_filters = self._build_inc(deltas)
+        if inc:
+            await self.db[collection].update_one({"id": doc_id}, {"$inc": inc}, array_filters=array_filters)
+
+    async def increment_and_read(self, collection: str, filter_query: dict,
+                                 deltas: Dict[str, int], fields: List[str]) -> Optional[dict]:
+        """Apply increments to the matching document and return its post-image.
+
+        Only ``id`` and ``fields`` are returned. Without buffering this is one
+        find_one_and_update. With buffering it is one projected read plus an
+        in-memory increment. Returns None when no document matches.
+        """
+        projection = {"_id": 0, "id": 1, **{field: 1 for field in fields}}
+        if self.enabled:
+            doc = await self.db[collection].find_one(filter_query, projection)
+            if doc is None:
+                return None
+            if any(deltas.values()):
+                self.increment(collection, doc["id"], deltas)
+            return self.merge(collection, doc)
+
+        inc, array_filters = self._build_inc(deltas)
+        if not inc:
+            return await self.db[collection].find_one(filter_query, projection)
+        return await self.db[collection].find_one_and_update(
+            filter_query,
+            {"$inc": inc},
+            projection=projection,
+            array_filters=array_filters,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    @staticmethod
+    def _build_inc(deltas: Dict[str, int]) -> Tuple[Dict[str, int], Optional[List[dict]]]:
+        inc: Dict[str, int] = {}
+        array_filters: List[dict] = []
+        for field, delta in deltas.items():
+            if not delta:
+                continue
+            if field.startswith(OPTION_VOTES_PREFIX):
+                name = f"o{len(array_filters)}"
+                inc[f"options.$[{name}].votes"] = delta
+                array_filters.append({f"{name}.id": field[len(OPTION_VOTES_PREFIX):]})
+            else:
+                inc[field] = delta
+        return inc, array_filters or None
+
+    async def flush(self) -> int:
+        """Write every pending delta, returning the number of documents updated"""
+        try:
+            drained: Dict[Tuple[str, str], Dict[str, int]] = {}
+            for shard in self._shards:
+                drained.update(shard)
+                shard.clear()
+            if not drained:
+                return 0
+
+            by_collection: Dict[str, List[Tuple[str, Dict[str, int]]]] = {}
+            for (collection, doc_id), deltas in drained.items():
+                by_collection.setdefault(collection, []).append((doc_id, deltas))
+
+            written = 0
+            for collection, items in by_collection.items():
+                operations = []
+                pending: List[Tuple[str, Dict[str, int]]] = []
+                for doc_id, deltas in items:
+                    inc, array_filters = self._build_inc(deltas)
+                    if inc:
+                        operations.append(UpdateOne({"id": doc_id}, {"$inc": inc}, array_filters=array_filters))
+                        pending.append((doc_id, deltas))
+                if not operations:
+                    continue
+                try:
+                    await self.db[collection].bulk_write(operations, ordered=False)
+                    written += len(operations)
+                except BulkWriteError as e:
+                    # Unordered: everything except the listed errors was applied
+                    failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                    logger.error(f"Counter flush for {collection}: {len(failed)} of {len(operations)} updates failed")
+                    written += len(operations) - len(failed)
+                    for index in failed:
+                        self._add(collection, *pending[index])
+                except Exception as e:
+                    # The whole batch failed; put the deltas back so the next flush retries them
+                    logger.error(f"Counter flush for {collection} failed: {e}")
+                    for doc_id, deltas in pending:
+                        self._add(collection, doc_id, deltas)
+
+            self.flushes += 1
+            self.flushed_updates += written
+            return written
+        finally:
+            self._flushing = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """Start the periodic flush loop"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write whatever is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        """Buffer counters for monitoring"""
+        return {
+            "enabled": self.enabled,
+            "dirty_documents": self.dirty_count(),
+            "flushes": self.flushes,
+            "flushed_updates": self.flushed_updates,
+        }
+
+
+async def toggle_counted_membership(
+    counters: CounterBuffer,
+    membership_collection: str,
+    membership: dict,
+    key: dict,
+    target_collection: str,
+    target_filter: dict,
+    counter_field: str,
+) -> Optional[Tuple[bool, int]]:
+    """Toggle a membership document (e.g. a like) and adjust its counter.
+
+    The insert relies on the unique index over ``key``: it either creates the
+    membership or fails with a duplicate key error, which means the caller is
+    toggling it off. The counter only drops when this call's delete removed
+    the membership; if a concurrent toggle removed it first, the count is just
+    read. The counter change and the read of the new count then happen in one
+    round trip. Returns ``(is_member, count)`` or None when the target document
+    does not exist, in which case the toggle is undone.
+    """
+    members = counters.db[membership_collection]
+    try:
+        await members.insert_one(membership)
+        is_member, delta = True, 1
+    except DuplicateKeyError:
+        result = await members.delete_one(key)
+        is_member, delta = False, -result.deleted_count
+
+    target = await counters.increment_and_read(
+        target_collection, target_filter, {counter_field: delta}, [counter_field]
+    )
+    if target is None:
+        if is_member:
+            await members.delete_one(key)
+        elif delta:
+            membership.pop("_id", None)
+            await members.insert_one(membership)
+        return None
+
+    return is_member, target[counter_field]
@@ -0,0 +1,178 @@
+"""
+Follow graph: edges, denormalized counts and cached adjacency sets.
+
+Edges live in ``follows`` with a unique (follower_id, following_id) index.
+Every follow/unfollow also adjusts ``followers_count`` and
+``following_count`` on both users in one bulk write, so counts are a field
+read. A user's following set is cached up to FOLLOW_GRAPH_MAX_CACHED_SET ids
+and updated in place on writes, which makes batch "does A follow B" checks
+free for active users.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from cache import TTLCache
+from pagination import CURSOR_SORT, apply_cursor, next_cursor
+
+COUNT_FIELDS = ("followers_count", "following_count")
+
+
+class FollowGraph:
+    """Reads and writes of the follow graph"""
+
+    def __init__(self, db, cache_size: int = 10000, ttl: float = 300, max_cached_set: int = 5000):
+        self.db = db
+        self.max_cached_set = max_cached_set
+        # user_id -> set of followed user ids
+        self._following = TTLCache(maxsize=cache_size, ttl=ttl)
+        # user_id -> (followers_count, following_count)
+        self._counts = TTLCache(maxsize=cache_size, ttl=ttl)
+
+    async def _ensure_counts(self, user_ids: List[str]) -> None:
+        """Backfill the stored counts of users created before they existed.
+
+        Runs before every edge write, so an ``$inc`` never lands on a missing
+        field. While a field is missing no edge write has passed this point,
+        which makes the count taken here exact.
+        """
+        user_ids = [user_id for user_id in user_ids if self._counts.get(user_id) is None]
+        if not user_ids:
+            return
+        async for user in self.db.users.find(
+            {"id": {"$in": user_ids}, "$or": [{field: {"$exists": False}} for field in COUNT_FIELDS]},
+            {"_id": 0, "id": 1}
+        ):
+            await self._backfill_counts(user["id"])
+
+    async def _adjust_counts(self, follower_id: str, following_id: str, delta: int) -> None:
+        await self.db.users.bulk_write([
+            UpdateOne({"id": follower_id}, {"$inc": {"following_count": delta}}),
+            UpdateOne({"id": following_id}, {"$inc": {"followers_count": delta}}),
+        ], ordered=False)
+        self._counts.invalidate(follower_id)
+        self._counts.invalidate(following_id)
+
+    async def follow(self, follow: dict) -> bool:
+        """Insert a follow edge; False if it already existed"""
+        await self._ensure_counts([follow["follower_id"], follow["following_id"]])
+        try:
+            await self.db.follows.insert_one(follow)
+        except DuplicateKeyError:
+            return False
+        await self._adjust_counts(follow["follower_id"], follow["following_id"], 1)
+        following = self._following.get(follow["follower_id"])
+        if following is not None:
+            following.add(follow["following_id"])
+        return True
+
+    async def unfollow(self, follower_id: str, following_id: str) -> bool:
+        """Delete a follow edge; False if there was none"""
+        await self._ensure_counts([follower_id, following_id])
+        result = await self.db.follows.delete_one({"follower_id": follower_id, "following_id": following_id})
+        if not result.deleted_count:
+            return False
+        await self._adjust_counts(follower_id, following_id, -1)
+        following = self._following.get(follower_id)
+        if following is not None:
+            following.discard(following_id)
+        return True
+
+    async def following_ids(self, user_id: str) -> Set[str]:
+        """Ids the user follows, cached unless the set is very large"""
+        following = self._following.get(user_id)
+        if following is None:
+            follows = await self.db.follows.find(
+                {"follower_id": user_id}, {"_id": 0, "following_id": 1}
+            ).to_list(None)
+            following = {follow["following_id"] for follow in follows}
+            if len(following) <= self.max_cached_set:
+                self._following.set(user_id, following)
+        return following
+
+    async def follows_many(self, follower_id: str, user_ids: Iterable[str]) -> Dict[str, bool]:
+        """Whether ``follower_id`` follows each of ``user_ids``, in one call"""
+        user_ids = list(dict.fromkeys(user_ids))
+        following = self._following.get(follower_id)
+        if following is None:
+            # Warm the adjacency set when it is small enough to cache
+            _, following_count = (await self.counts([follower_id])).get(follower_id, (0, 0))
+            if following_count <= self.max_cached_set:
+                following = await self.following_ids(follower_id)
+        if following is None:
+            follows = await self.db.follows.find(
+                {"follower_id": follower_id, "following_id": {"$in": user_ids}},
+                {"_id": 0, "following_id": 1}
+            ).to_list(len(user_ids))
+            following = {follow["following_id"] for follow in follows}
+        return {user_id: user_id in following for user_id in user_ids}
+
+    async def follow_ids(self, follower_id: str, user_ids: Iterable[str]) -> Dict[str, str]:
+        """Follow document id per followed user among ``user_ids``, in one query"""
+        user_ids = list(dict.fromkeys(user_ids))
+        follows = await self.db.follows.find(
+            {"follower_id": follower_id, "following_id": {"$in": user_ids}},
+            {"_id": 0, "id": 1, "following_id": 1}
+        ).to_list(len(user_ids))
+        return {follow["following_id"]: follow["id"] for follow in follows}
+
+    async def counts(self, user_ids: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        """(followers_count, following_count) per existing user.
+
+        Users created before counts were stored are counted once and backfilled.
+        """
+        result: Dict[str, Tuple[int, int]] = {}
+        missing: List[str] = []
+        for user_id in dict.fromkeys(user_ids):
+            cached = self._counts.get(user_id)
+            if cached is not None:
+                result[user_id] = cached
+            else:
+                missing.append(user_id)
+        if not missing:
+            return result
+
+        users = await self.db.users.find(
+            {"id": {"$in": missing}}, {"_id": 0, "id": 1, **{field: 1 for field in COUNT_FIELDS}}
+        ).to_list(len(missing))
+        for user in users:
+            if any(field not in user for field in COUNT_FIELDS):
+                user.update(await self._backfill_counts(user["id"]))
+            counts = (max(user["followers_count"], 0), max(user["following_count"], 0))
+            self._counts.set(user["id"], counts)
+            result[user["id"]] = counts
+        return result
+
+    async def _backfill_counts(self, user_id: str) -> dict:
+        counts = {
+            "followers_count": await self.db.follows.count_documents({"following_id": user_id}),
+            "following_count": await self.db.follows.count_documents({"follower_id": user_id}),
+        }
+        # Only fill fields that are still missing; a concurrent backfill may have won
+        await self.db.users.bulk_write([
+            UpdateOne({"id": user_id, field: {"$exists": False}}, {"$set": {field: value}})
+            for field, value in counts.items()
+        ], ordered=False)
+        user = await self.db.users.find_one({"id": user_id}, {"_id": 0, **{field: 1 for field in COUNT_FIELDS}})
+        return {field: user.get(field, counts[field]) for field in COUNT_FIELDS} if user else counts
+
+    async def _page(self, field: str, user_id: str, other_field: str, limit: int,
+                    cursor: Optional[str]) -> Tuple[List[str], Optional[str]]:
+        follows = await self.db.follows.find(
+            apply_cursor({field: user_id}, cursor), {"_id": 0, "id": 1, "created_at": 1, other_field: 1}
+        ).sort(CURSOR_SORT).limit(limit).to_list(limit)
+        return [follow[other_field] for follow in follows], next_cursor(follows, limit)
+
+    async def followers_page(self, user_id: str, limit: int,
+                             cursor: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        """One page of follower ids, newest first, and the next cursor"""
+        return await self._page("following_id", user_id, "follower_id", limit, cursor)
+
+    async def following_page(self, user_id: str, limit: int,
+                             cursor: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        """One page of followed ids, newest first, and the next cursor"""
+        return await self._page("follower_id", user_id, "following_id", limit, cursor)
+
+    def stats(self) -> dict:
+        return {"following_sets": self._following.stats(), "counts": self._counts.stats()}
@@ -0,0 +1,277 @@
+"""
+MongoDB index declarations and startup bootstrapper.
+
+Every query issued from server.py should be backed by one of the indexes
+declared here. Indexes are created idempotently on application startup and
+can be audited at runtime with ``get_index_report``.
+"""
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+# Declared indexes per collection. Names are explicit so the report can
+# compare what we expect against what the server actually has.
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        # Popular accounts used to fill short follow suggestion lists
+        IndexModel([("followers_count", DESCENDING)], name="followers_count"),
+        # /users/search: prefix range scans ranked by follower count
+        IndexModel(
+            [("username_key", ASCENDING), ("followers_count", DESCENDING), ("id", ASCENDING)],
+            name="username_key_followers"
+        ),
+        IndexModel(
+            [("search_keys", ASCENDING), ("followers_count", DESCENDING), ("id", ASCENDING)],
+            name="search_keys_followers"
+        ),
+    ],
+    "user_profiles": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "login_attempts": [
+        # check_rate_limit counts recent failures by email and by IP
+        IndexModel(
+            [("email", ASCENDING), ("success", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="email_success_created_at_id",
+        ),
+        IndexModel(
+            [("ip_address", ASCENDING), ("success", ASCENDING), ("created_at", DESCENDING)],
+            name="ip_success_created_at",
+        ),
+        IndexModel(
+            [("created_at", ASCENDING)],
+            name="created_at_ttl",
+            expireAfterSeconds=config.LOGIN_ATTEMPT_TTL_DAYS * 24 * 3600,
+        ),
+    ],
+    "user_devices": [
+        IndexModel([("user_id", ASCENDING), ("id", ASCENDING)], name="user_id_id"),
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("user_id", ASCENDING), ("last_used", DESCENDING)], name="user_id_last_used"),
+    ],
+    "user_sessions": [
+        IndexModel([("user_id", ASCENDING), ("device_id", ASCENDING)], name="user_id_device_id"),
+        # Sessions are removed by the server once expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "security_notifications": [
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="user_id_created_at_id",
+        ),
+        IndexModel([("id", ASCENDING), ("user_id", ASCENDING)], name="id_user_id"),
+    ],
+    "follows": [
+        IndexModel(
+            [("follower_id", ASCENDING), ("following_id", ASCENDING)],
+            name="follower_following_unique",
+            unique=True,
+        ),
+        # Follower and following lists page on (created_at, id)
+        IndexModel(
+            [("following_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="following_id_created_at_id",
+        ),
+        IndexModel(
+            [("follower_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="follower_id_created_at_id",
+        ),
+    ],
+    "conversations": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # One conversation per pair of users; older documents without a key are skipped
+        IndexModel(
+            [("pair_key", ASCENDING)],
+            name="pair_key_unique",
+            unique=True,
+            partialFilterExpression={"pair_key": {"$type": "string"}},
+        ),
+        # Inbox pages sort by (last_message_at, id) for keyset pagination
+        IndexModel(
+            [("participants", ASCENDING), ("is_active", ASCENDING), ("last_message_at", DESCENDING), ("id", DESCENDING)],
+            name="participants_active_last_message_at_id",
+        ),
+    ],
+    "messages": [
+        # before/after cursors page on (created_at, id) within a conversation
+        IndexModel(
+            [("conversation_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="conversation_id_created_at_id",
+        ),
+        # Messages still unread after a participant's read watermark
+        IndexModel(
+            [("conversation_id", ASCENDING), ("recipient_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="conversation_id_recipient_id_created_at_id",
+        ),
+    ],
+    "follow_suggestions": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "unread_counters": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "comments": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("poll_id", ASCENDING), ("created_at", ASCENDING)], name="poll_id_created_at"),
+        # Paginated comment tree: root comments per poll and replies per parent
+        IndexModel(
+            [("poll_id", ASCENDING), ("parent_comment_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="poll_id_parent_comment_id_created_at_id",
+        ),
+        IndexModel(
+            [("parent_comment_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="parent_comment_id_created_at_id",
+        ),
+        # Materialized path: subtree reads, counts and deletes (multikey)
+        IndexModel([("ancestors", ASCENDING), ("depth", ASCENDING)], name="ancestors_depth"),
+    ],
+    "comment_likes": [
+        IndexModel(
+            [("comment_id", ASCENDING), ("user_id", ASCENDING)],
+            name="comment_id_user_id_unique",
+            unique=True,
+        ),
+        IndexModel([("user_id", ASCENDING), ("comment_id", ASCENDING)], name="user_id_comment_id"),
+    ],
+    "polls": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Feed pages sort by (created_at, id) for keyset pagination
+        IndexModel(
+            [("is_active", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="is_active_created_at_id",
+        ),
+        IndexModel(
+            [("is_active", ASCENDING), ("category", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="is_active_category_created_at_id",
+        ),
+        IndexModel(
+            [("is_active", ASCENDING), ("is_featured", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="is_active_is_featured_created_at_id",
+        ),
+        # Polls of fan-out-on-read authors are pulled into followers' timelines
+        IndexModel(
+            [("author_id", ASCENDING), ("is_active", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="author_id_is_active_created_at_id",
+        ),
+    ],
+    "timelines": [
+        IndexModel([("user_id", ASCENDING), ("id", ASCENDING)], name="user_id_id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="user_id_created_at_id",
+        ),
+        # Unfollow removes one author's entries from a reader's timeline
+        IndexModel([("user_id", ASCENDING), ("author_id", ASCENDING)], name="user_id_author_id"),
+    ],
+    "votes": [
+        IndexModel(
+            [("poll_id", ASCENDING), ("user_id", ASCENDING)],
+            name="poll_id_user_id_unique",
+            unique=True,
+        ),
+        IndexModel([("user_id", ASCENDING), ("poll_id", ASCENDING)], name="user_id_poll_id"),
+    ],
+    "poll_likes": [
+        IndexModel(
+            [("poll_id", ASCENDING), ("user_id", ASCENDING)],
+            name="poll_id_user_id_unique",
+            unique=True,
+        ),
+        IndexModel([("user_id", ASCENDING), ("poll_id", ASCENDING)], name="user_id_poll_id"),
+    ],
+    "uploaded_files": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("uploader_id", ASCENDING), ("upload_type", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="uploader_id_upload_type_created_at_id",
+        ),
+        IndexModel(
+            [("uploader_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="uploader_id_created_at_id",
+        ),
+    ],
+}
+
+
+# Unique indexes that writes rely on for correctness: like toggles insert
+# first and treat a duplicate key as "already liked", votes upsert per user.
+# Without them repeated requests create duplicates instead of toggling.
+REQUIRED_INDEXES: Dict[str, List[str]] = {
+    "poll_likes": ["poll_id_user_id_unique"],
+    "comment_likes": ["comment_id_user_id_unique"],
+    "votes": ["poll_id_user_id_unique"],
+}
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create all declared indexes, returning the names that failed per collection.
+
+    Each index is created on its own so one conflicting definition (for example
+    a unique index over data that still has duplicates) does not prevent the
+    rest from being built. Re-running against an up-to-date database is a no-op.
+    """
+    failures: Dict[str, List[str]] = {}
+    for collection_name, indexes in INDEX_SPECS.items():
+        collection = db[collection_name]
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                logger.warning("Could not create index %s.%s: %s", collection_name, name, e)
+                failures.setdefault(collection_name, []).append(name)
+    return failures
+
+
+async def check_required_indexes(db) -> None:
+    """Raise if any index in REQUIRED_INDEXES is missing from the database"""
+    missing = []
+    for collection_name, names in REQUIRED_INDEXES.items():
+        existing = await db[collection_name].index_information()
+        missing.extend(f"{collection_name}.{name}" for name in names if name not in existing)
+    if missing:
+        raise RuntimeError(
+            f"Required unique indexes are missing: {', '.join(missing)}. "
+            "Remove duplicate documents (migrate_dedupe_likes.py does this for likes) and create them."
+        )
+
+
+async def get_index_report(db) -> Dict[str, Dict[str, List[str]]]:
+    """Compare declared indexes against the live database.
+
+    For every collection the report lists declared indexes that are
+    ``missing``, indexes present on the server but not declared here
+    (``undeclared``) and indexes that have served no operations since the
+    server last started (``unused``, from ``$indexStats``).
+    """
+    report: Dict[str, Dict[str, List[str]]] = {}
+    for collection_name, indexes in INDEX_SPECS.items():
+        collection = db[collection_name]
+        declared = {index.document["name"] for index in indexes}
+        existing = set((await collection.index_information()).keys()) - {"_id_"}
+
+        unused: List[str] = []
+        try:
+            async for stats in collection.aggregate([{"$indexStats": {}}]):
+                if stats["name"] != "_id_" and stats.get("accesses", {}).get("ops", 0) == 0:
+                    unused.append(stats["name"])
+        except OperationFailure:
+            # $indexStats is not available on every deployment
+            pass
+
+        report[collection_name] = {
+            "missing": sorted(declared - existing),
+            "undeclared": sorted(existing - declared),
+            "unused": sorted(unused),
+        }
+    return report
@@ -0,0 +1,33 @@
+"""
+Lease locks for background jobs shared by several API workers.
+
+Every worker starts the same periodic jobs on startup. A job that should
+run once per deployment takes a lease in the ``job_locks`` collection
+before each pass. The holder renews its lease on every pass. The lease
+expires after ``ttl`` seconds if the holder dies, and another worker then
+takes over.
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+# Identifies this process as a lease holder
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def acquire_lease(db, name: str, ttl: float) -> bool:
+    """Take or renew the lease ``name`` for ``ttl`` seconds; False if another worker holds it"""
+    now = datetime.utcnow()
+    try:
+        await db.job_locks.find_one_and_update(
+            {"_id": name, "$or": [{"owner": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The lease exists and is held by someone else
+        return False
+    return True
@@ -0,0 +1,96 @@
+"""
+Request-scoped batching loaders.
+
+A loader collects every id requested while a response is being built and
+resolves them with a single ``$in`` query per event-loop tick, caching the
+results for the rest of the request.
+"""
+import asyncio
+from typing import Dict, Iterable, List, Optional
+
+from models import UserResponse
+
+# Only the fields UserResponse needs, never the password hash
+USER_RESPONSE_PROJECTION = {"_id": 0, **{field: 1 for field in UserResponse.model_fields}}
+# Plus the stored follower count, shown next to poll options
+USER_LOADER_PROJECTION = {**USER_RESPONSE_PROJECTION, "followers_count": 1}
+
+
+class UserLoader:
+    """Batches and caches user lookups made while handling one request"""
+
+    def __init__(self, db, projection: Optional[dict] = None):
+        self._db = db
+        self._projection = projection or USER_LOADER_PROJECTION
+        self._cache: Dict[str, Optional[dict]] = {}
+        self._queue: Dict[str, asyncio.Future] = {}
+        self._dispatch_scheduled = False
+        self.queries = 0
+
+    def prime(self, user: dict) -> None:
+        """Seed the cache with a user document that is already known"""
+        self._cache[user["id"]] = user
+
+    def _enqueue(self, user_id: str) -> asyncio.Future:
+        future = self._queue.get(user_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._queue[user_id] = future
+        if not self._dispatch_scheduled:
+            self._dispatch_scheduled = True
+            asyncio.get_running_loop().call_soon(
+                lambda: asyncio.ensure_future(self._dispatch())
+            )
+        return future
+
+    async def _dispatch(self) -> None:
+        batch, self._queue = self._queue, {}
+        self._dispatch_scheduled = False
+        if not batch:
+            return
+        try:
+            self.queries += 1
+            docs = await self._db.users.find(
+                {"id": {"$in": list(batch)}}, self._projection
+            ).to_list(len(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        found = {doc["id"]: doc for doc in docs}
+        for user_id, future in batch.items():
+            self._cache[user_id] = found.get(user_id)
+            if not future.done():
+                future.set_result(found.get(user_id))
+
+    async def load(self, user_id: str) -> Optional[dict]:
+        """Load a single user document, or None if it does not exist"""
+        if user_id in self._cache:
+            return self._cache[user_id]
+        return await self._enqueue(user_id)
+
+    async def load_many(self, user_ids: Iterable[str]) -> Dict[str, dict]:
+        """Load several users at once, returning only those that exist"""
+        user_ids = list(dict.fromkeys(user_ids))
+        pending: List[asyncio.Future] = [
+            self._enqueue(user_id) for user_id in user_ids if user_id not in self._cache
+        ]
+        if pending:
+            await asyncio.gather(*pending)
+        return {
+            user_id: self._cache[user_id]
+            for user_id in user_ids
+            if self._cache.get(user_id)
+        }
+
+    async def load_response(self, user_id: str) -> Optional[UserResponse]:
+        """Load a single user as a UserResponse"""
+        user = await self.load(user_id)
+        return UserResponse(**user) if user else None
+
+    async def load_responses(self, user_ids: Iterable[str]) -> Dict[str, UserResponse]:
+        """Load several users as UserResponse objects keyed by id"""
+        users = await self.load_many(user_ids)
+        return {user_id: UserResponse(**user) for user_id, user in users.items()}
@@ -32,6 +32,12 @@ class User(BaseModel):
     is_active: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
     last_login: Optional[datetime] = None
+    # Denormalized follow graph counts, maintained on follow/unfollow
+    followers_count: int = 0
+    following_count: int = 0
+    # Normalized search keys, see user_search.search_fields
+    username_key: Optional[str] = None
+    search_keys: List[str] = []
     # Privacy settings
     is_public: bool = True
     allow_messages: bool = True
@@ -149,9 +155,11 @@ class MessageCreate(BaseModel):
 class Conversation(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     participants: List[str]  # user_ids
+    pair_key: Optional[str] = None  # sorted participant ids, "a:b" (unique)
     last_message: Optional[str] = None
     last_message_at: Optional[datetime] = None
     unread_count: Dict[str, int] = {}  # user_id -> unread count
+    read_watermarks: Dict[str, Dict[str, Any]] = {}  # user_id -> {id, created_at} of the last message read
     is_active: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -185,13 +193,35 @@ class FollowStatus(BaseModel):
     is_following: bool
     follow_id: Optional[str] = None
 
+class FollowStatusBatchRequest(BaseModel):
+    user_ids: List[str]
+
+class FollowStatusBatch(BaseModel):
+    statuses: Dict[str, FollowStatus]  # user_id -> estado de seguimiento
+
+class SuggestedUser(BaseModel):
+    user: UserResponse
+    score: float
+    mutual_follows: int = 0  # Seguidos del usuario que siguen a este
+    shared_votes: int = 0  # Encuestas en las que ambos votaron
+    reason: str  # mutual_follows, shared_votes o popular
+
+class FollowSuggestions(BaseModel):
+    suggestions: List[SuggestedUser]
+    computed_at: Optional[datetime] = None
+    stale: bool = False  # True mientras se recalculan en segundo plano
+
 class FollowingList(BaseModel):
     following: List[UserResponse]
     total: int
+    # Cursor of the next page, also sent as the X-Next-Cursor header
+    next_cursor: Optional[str] = None
 
 class FollowersList(BaseModel):
     followers: List[UserResponse]
     total: int
+    # Cursor of the next page, also sent as the X-Next-Cursor header
+    next_cursor: Optional[str] = None
 
 # =============  COMMENT MODELS =============
 
@@ -201,6 +231,10 @@ class Comment(BaseModel):
     user_id: str  # ID del usuario que creó el comentario
     content: str  # Contenido del comentario
     parent_comment_id: Optional[str] = None  # ID del comentario padre (para anidamiento)
+    ancestors: List[str] = []  # IDs de los ancestros, desde la raíz hasta el padre
+    root_id: Optional[str] = None  # ID del comentario raíz del hilo (None si es raíz)
+    depth: int = 0  # Nivel de anidamiento (0 para comentarios raíz)
+    reply_count: int = 0  # Número de respuestas directas, mantenido al escribir
     likes: int = 0  # Número de likes en el comentario
     is_edited: bool = False  # Si el comentario ha sido editado
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -228,8 +262,11 @@ class CommentResponse(BaseModel):
     updated_at: datetime
     # Para anidamiento
     replies: List["CommentResponse"] = []  # Lista de comentarios hijos
-    reply_count: int = 0  # Conteo total de respuestas anidadas
+    # Respuestas directas en /comments/tree, /comments/{id}/replies y /comments/{id};
+    # GET /polls/{id}/comments devuelve el total de respuestas anidadas
+    reply_count: int = 0
     user_liked: bool = False  # Si el usuario actual le dio like
+    replies_cursor: Optional[str] = None  # Cursor para cargar más respuestas
 
 class CommentLike(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -0,0 +1,97 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is an opaque, URL-safe token encoding the sort key (``created_at``
+unless stated otherwise) and ``id`` of the last document of a page. The next
+page continues strictly after that position, so the cost of a page does not
+grow with how deep the client has scrolled, unlike ``skip(offset)``.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+
+# Sort order every cursor-paginated query must use
+CURSOR_SORT = [("created_at", -1), ("id", -1)]
+# Same keys oldest first, for chronological lists such as comment threads
+CURSOR_SORT_ASC = [("created_at", 1), ("id", 1)]
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Bidirectional lists such as chat history page both ways from the current view
+BEFORE_CURSOR_HEADER = "X-Before-Cursor"
+AFTER_CURSOR_HEADER = "X-After-Cursor"
+
+
+def encode_cursor(document: dict, field: str = "created_at") -> str:
+    """Build the cursor pointing just after ``document``"""
+    value = document.get(field)
+    payload = {"t": value.isoformat() if value else None, "i": document["id"]}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    """Decode a cursor, raising a 400 error if it was tampered with"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.fromisoformat(payload["t"]) if payload["t"] is not None else None
+        return value, str(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def apply_cursor(filter_query: dict, cursor: Optional[str], ascending: bool = False,
+                 field: str = "created_at") -> dict:
+    """Restrict a filter to documents after the cursor.
+
+    The order is CURSOR_SORT, or CURSOR_SORT_ASC when ``ascending`` is set,
+    with ``field`` in place of created_at. Documents where ``field`` is null
+    sort before every date, as MongoDB orders them.
+    """
+    if not cursor:
+        return filter_query
+    value, last_id = decode_cursor(cursor)
+    after = "$gt" if ascending else "$lt"
+    conditions = [{field: value, "id": {after: last_id}}]
+    if value is not None:
+        conditions.append({field: {after: value}})
+        if not ascending:
+            conditions.append({field: None})
+    elif ascending:
+        conditions.append({field: {"$ne": None}})
+    return {"$and": [filter_query, {"$or": conditions}]}
+
+
+def next_cursor(documents: List[dict], limit: int, field: str = "created_at") -> Optional[str]:
+    """Cursor for the following page, or None when this page was the last"""
+    if len(documents) < limit or not documents:
+        return None
+    return encode_cursor(documents[-1], field)
+
+
+async def find_page(
+    collection,
+    filter_query: dict,
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+    response: Response,
+    projection: Optional[dict] = None,
+) -> List[dict]:
+    """Fetch one page in cursor mode, or offset mode when no cursor is given.
+
+    Both modes advertise the cursor of the next page in the X-Next-Cursor
+    response header so offset clients can switch over at any point.
+    """
+    query = collection.find(apply_cursor(filter_query, cursor), projection).sort(CURSOR_SORT)
+    if not cursor and offset:
+        query = query.skip(offset)
+    documents = await query.limit(limit).to_list(limit)
+
+    cursor_for_next = next_cursor(documents, limit)
+    if cursor_for_next:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_for_next
+    return documents
@@ -0,0 +1,133 @@
+"""
+Ranked "For You" feed engine.
+
+Candidate polls are loaded into NumPy arrays and scored in one vectorized
+pass by a weighted set of pluggable scorers. The ranked poll ids for each
+user are cached for a short TTL so paging through the feed does not rescore.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from cache import TTLCache
+from config import config
+
+
+@dataclass
+class CandidateBatch:
+    """Column-oriented features of the candidate polls"""
+    ids: List[str]
+    age_hours: np.ndarray
+    likes: np.ndarray
+    shares: np.ndarray
+    comments: np.ndarray
+    votes: np.ndarray
+    featured: np.ndarray
+    followed: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+Scorer = Callable[[CandidateBatch], np.ndarray]
+
+CANDIDATE_PROJECTION = {
+    "_id": 0, "id": 1, "author_id": 1, "created_at": 1, "likes": 1, "shares": 1,
+    "comments_count": 1, "total_votes": 1, "is_featured": 1,
+}
+
+
+def recency_decay(batch: CandidateBatch) -> np.ndarray:
+    """Halve a poll's score every RANKING_HALF_LIFE_HOURS"""
+    return np.exp2(-batch.age_hours / config.RANKING_HALF_LIFE_HOURS)
+
+
+def engagement_velocity(batch: CandidateBatch) -> np.ndarray:
+    """Weighted engagement per hour of age, dampened logarithmically"""
+    engagement = batch.votes + batch.likes + 2.0 * batch.comments + 3.0 * batch.shares
+    return np.log1p(engagement) / np.power(batch.age_hours + 2.0, config.RANKING_GRAVITY)
+
+
+def follow_affinity(batch: CandidateBatch) -> np.ndarray:
+    """Prefer polls by authors the viewer follows"""
+    return batch.followed.astype(np.float64)
+
+
+def featured_boost(batch: CandidateBatch) -> np.ndarray:
+    """Editorially featured polls"""
+    return batch.featured.astype(np.float64)
+
+
+class RankingEngine:
+    """Scores candidates with a weighted sum of scorers"""
+
+    def __init__(self, scorers: Optional[List[Tuple[float, Scorer]]] = None):
+        self.scorers: List[Tuple[float, Scorer]] = scorers if scorers is not None else [
+            (1.0, recency_decay),
+            (4.0, engagement_velocity),
+            (0.5, follow_affinity),
+            (0.3, featured_boost),
+        ]
+        self._ranked_pages = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.RANKING_CACHE_TTL_SECONDS)
+
+    def register(self, scorer: Scorer, weight: float = 1.0) -> None:
+        """Add a scorer to the weighted sum"""
+        self.scorers.append((weight, scorer))
+        self._ranked_pages.clear()
+
+    def score(self, batch: CandidateBatch) -> np.ndarray:
+        """Score every candidate in one vectorized pass"""
+        scores = np.zeros(len(batch), dtype=np.float64)
+        for weight, scorer in self.scorers:
+            scores += weight * scorer(batch)
+        return scores
+
+    def rank(self, batch: CandidateBatch) -> List[str]:
+        """Candidate ids ordered from best to worst score"""
+        if not len(batch):
+            return []
+        order = np.argsort(-self.score(batch), kind="stable")
+        return [batch.ids[i] for i in order]
+
+    @staticmethod
+    def build_batch(polls: List[dict], followed_ids: Set[str], now: Optional[datetime] = None) -> CandidateBatch:
+        """Turn candidate poll documents into feature columns"""
+        now = now or datetime.utcnow()
+        return CandidateBatch(
+            ids=[poll["id"] for poll in polls],
+            age_hours=np.fromiter(
+                ((now - poll["created_at"]).total_seconds() / 3600 for poll in polls),
+                dtype=np.float64, count=len(polls)
+            ).clip(min=0),
+            likes=np.fromiter((poll.get("likes", 0) for poll in polls), dtype=np.float64, count=len(polls)),
+            shares=np.fromiter((poll.get("shares", 0) for poll in polls), dtype=np.float64, count=len(polls)),
+            comments=np.fromiter((poll.get("comments_count", 0) for poll in polls), dtype=np.float64, count=len(polls)),
+            votes=np.fromiter((poll.get("total_votes", 0) for poll in polls), dtype=np.float64, count=len(polls)),
+            featured=np.fromiter((bool(poll.get("is_featured")) for poll in polls), dtype=bool, count=len(polls)),
+            followed=np.fromiter((poll["author_id"] in followed_ids for poll in polls), dtype=bool, count=len(polls)),
+        )
+
+    async def get_ranked_ids(self, db, user_id: str, filter_query: Optional[dict] = None) -> List[str]:
+        """Ranked candidate ids for a user, cached for RANKING_CACHE_TTL_SECONDS"""
+        filter_query = filter_query or {"is_active": True}
+        cache_key = (user_id, tuple(sorted(filter_query.items())))
+        cached = self._ranked_pages.get(cache_key)
+        if cached is not None:
+            return cached
+
+        since = datetime.utcnow() - timedelta(days=config.RANKING_CANDIDATE_DAYS)
+        polls = await db.polls.find(
+            {**filter_query, "created_at": {"$gte": since}}, CANDIDATE_PROJECTION
+        ).sort("created_at", -1).limit(config.RANKING_CANDIDATE_LIMIT).to_list(config.RANKING_CANDIDATE_LIMIT)
+
+        follows = await db.follows.find({"follower_id": user_id}, {"following_id": 1}).to_list(None)
+        followed_ids = {follow["following_id"] for follow in follows}
+
+        ranked_ids = self.rank(self.build_batch(polls, followed_ids))
+        self._ranked_pages.set(cache_key, ranked_ids)
+        return ranked_ids
+
+
+ranking_engine = RankingEngine()
@@ -0,0 +1,158 @@
+"""
+Real-time event fan-out for WebSocket clients.
+
+Events are published to per-user channels and delivered to every WebSocket
+that user has open. The PubSub backend is pluggable:
+
+- ``InMemoryPubSub`` delivers within the current process. It is the default
+  and what tests use.
+- ``RedisPubSub`` relays events through Redis pub/sub, so any API worker can
+  reach sockets held by another. It needs the optional ``redis`` package.
+
+Each subscriber gets a bounded queue. A client that stops reading loses its
+oldest events instead of slowing down publishers.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "user:"
+
+# Event types pushed to clients
+MESSAGE_NEW = "message.new"
+CONVERSATION_READ = "conversation.read"
+UNREAD_COUNT = "unread.count"
+
+
+def user_channel(user_id: str) -> str:
+    """Channel carrying every event addressed to one user"""
+    return f"{CHANNEL_PREFIX}{user_id}"
+
+
+class Subscription:
+    """Bounded queue of events for one open connection"""
+
+    def __init__(self, channel: str, maxsize: int = 100):
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def deliver(self, event: dict) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class InMemoryPubSub:
+    """Process-local pub/sub"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+
+    def _deliver(self, channel: str, event: dict) -> None:
+        for subscription in list(self._subscriptions.get(channel, ())):
+            subscription.deliver(event)
+
+    async def publish(self, channel: str, event: dict) -> None:
+        """Send an event to every subscriber of ``channel``"""
+        self.published += 1
+        self._deliver(channel, event)
+
+    async def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(channel, self.queue_size)
+        self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscriptions.get(subscription.channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscriptions[subscription.channel]
+
+    def is_subscribed(self, channel: str) -> bool:
+        """Whether anyone may be listening on ``channel``"""
+        return channel in self._subscriptions
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "channels": len(self._subscriptions),
+            "connections": sum(len(subscribers) for subscribers in self._subscriptions.values()),
+            "published": self.published,
+        }
+
+
+class RedisPubSub(InMemoryPubSub):
+    """Pub/sub relayed through Redis so events reach sockets on every worker.
+
+    Local connections are tracked exactly like InMemoryPubSub. Publishing goes
+    to Redis, and one pattern subscription per process delivers whatever
+    arrives to the local subscribers.
+    """
+
+    def __init__(self, url: str, queue_size: int = 100):
+        super().__init__(queue_size)
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("PUBSUB_BACKEND=redis requires the 'redis' package")
+        self._redis = redis.from_url(url)
+        self._listener: Optional[asyncio.Task] = None
+
+    async def publish(self, channel: str, event: dict) -> None:
+        self.published += 1
+        await self._redis.publish(channel, json.dumps(event, default=str))
+
+    def is_subscribed(self, channel: str) -> bool:
+        # Subscribers may be connected to another worker
+        return True
+
+    async def _listen(self) -> None:
+        pubsub = self._redis.pubsub()
+        await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._deliver(message["channel"].decode(), json.loads(message["data"]))
+            except asyncio.CancelledError:
+                await pubsub.close()
+                raise
+            except Exception as e:
+                logger.error(f"Redis pub/sub listener failed: {e}")
+                await asyncio.sleep(1)
+
+    async def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.ensure_future(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await self._redis.close()
+
+
+def create_pubsub(backend: str, redis_url: str = "", queue_size: int = 100) -> InMemoryPubSub:
+    """Build the pub/sub backend named by PUBSUB_BACKEND"""
+    if backend == "redis":
+        return RedisPubSub(redis_url, queue_size)
+    if backend != "memory":
+        raise ValueError(f"Unknown pub/sub backend: {backend}")
+    return InMemoryPubSub(queue_size)
@@ -1,10 +1,13 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response, UploadFile, File, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
@@ -13,6 +16,7 @@ from typing import List, Dict, Optional
 import uuid
 from datetime import datetime, date, timedelta
 import random
+import math
 import asyncio
 import re
 import hashlib
@@ -30,14 +34,37 @@ from models import (
     UserUpdate, PasswordChange, UserSettings,
     Comment, CommentCreate, CommentUpdate, CommentResponse, CommentLike,
     Follow, FollowCreate, FollowResponse, FollowStatus, FollowingList, FollowersList,
+    FollowStatusBatchRequest, FollowStatusBatch, SuggestedUser, FollowSuggestions,
     LoginAttempt, UserDevice, UserSession, SecurityNotification,
-    Poll, PollCreate, PollResponse, PollOption, Vote, VoteCreate, PollLike, Music,
+    Poll, PollCreate, PollResponse, PollOption, VoteCreate, PollLike, Music,
     UploadType, FileType, UploadedFile, UploadResponse
 )
 from auth import (
-    verify_password, get_password_hash, create_access_token, 
-    verify_token, ACCESS_TOKEN_EXPIRE_MINUTES
+    create_user_access_token, verify_token, password_hasher, PasswordHasherBusy,
+    ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from cache import TTLCache
+from loaders import UserLoader, USER_RESPONSE_PROJECTION
+from comment_tree import (
+    PATH_PROJECTION, adjust_reply_count, child_path, delete_subtree, load_subtree, run_reconciler
+)
+from pagination import (
+    find_page, apply_cursor, encode_cursor, next_cursor,
+    CURSOR_SORT, CURSOR_SORT_ASC, NEXT_CURSOR_HEADER, BEFORE_CURSOR_HEADER, AFTER_CURSOR_HEADER
+)
+from timeline import (
+    fan_out_poll, read_timeline, invalidate_followees, add_author_to_timeline, remove_author_from_timeline,
+    run_trimmer
+)
+from ranking import ranking_engine
+from voting import cast_vote
+from counters import CounterBuffer, toggle_counted_membership
+from indexes import ensure_indexes, check_required_indexes, get_index_report
+from unread import UnreadCounter
+from follow_graph import FollowGraph
+from user_search import find_users, search_fields
+import suggestions as follow_suggestions
+from realtime import create_pubsub, user_channel, MESSAGE_NEW, CONVERSATION_READ, UNREAD_COUNT
 
 # Import configuration
 from config import config
@@ -50,6 +77,30 @@ mongo_url = config.MONGO_URL
 client = AsyncIOMotorClient(mongo_url)
 db = client[config.DB_NAME]
 
+logger = logging.getLogger(__name__)
+
+# Authenticated users by id, invalidated whenever a user document changes
+user_cache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL_SECONDS)
+
+# Likes, shares and votes on polls and comments are written behind in bulk
+counter_buffer = CounterBuffer(
+    db,
+    enabled=config.COUNTER_BUFFER_ENABLED,
+    flush_interval=config.COUNTER_FLUSH_INTERVAL_SECONDS,
+    flush_threshold=config.COUNTER_FLUSH_THRESHOLD
+)
+comment_reconciler_task: Optional[asyncio.Task] = None
+suggestions_task: Optional[asyncio.Task] = None
+timeline_trim_task: Optional[asyncio.Task] = None
+follow_graph = FollowGraph(
+    db,
+    cache_size=config.USER_CACHE_SIZE,
+    ttl=config.FOLLOW_GRAPH_CACHE_TTL_SECONDS,
+    max_cached_set=config.FOLLOW_GRAPH_MAX_CACHED_SET
+)
+unread_counter = UnreadCounter(db, config.USER_CACHE_SIZE, config.UNREAD_CACHE_TTL_SECONDS)
+pubsub = create_pubsub(config.PUBSUB_BACKEND, config.REDIS_URL, config.WEBSOCKET_QUEUE_SIZE)
+
 # Create the main app without a prefix
 app = FastAPI(
     title="Social Media Network", 
@@ -73,7 +124,10 @@ security = HTTPBearer()
 # Authentication dependency
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserResponse:
     """Get current authenticated user"""
-    token = credentials.credentials
+    return await get_user_from_token(credentials.credentials)
+
+async def get_user_from_token(token: str) -> UserResponse:
+    """Resolve a bearer token to its user, raising 401 if it is not valid"""
     payload = verify_token(token)
     if not payload:
         raise HTTPException(
@@ -82,8 +136,18 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    user_id = payload["sub"]
+    
+    # Claims-only tokens carry the user fields themselves
+    if config.AUTH_CLAIMS_ONLY and payload.get("usr"):
+        return UserResponse(**payload["usr"])
+    
+    cached_user = user_cache.get(user_id)
+    if cached_user:
+        return cached_user
+    
     # Get user from database
-    user_data = await db.users.find_one({"id": payload["sub"]})
+    user_data = await db.users.find_one({"id": user_id}, USER_RESPONSE_PROJECTION)
     if not user_data:
         raise HTTPException(
             status_code=config.StatusCodes.UNAUTHORIZED,
@@ -91,7 +155,19 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return UserResponse(**user_data)
+    user = UserResponse(**user_data)
+    user_cache.set(user_id, user)
+    return user
+
+async def get_admin_user(current_user: UserResponse = Depends(get_current_user)) -> UserResponse:
+    """Current user, only if listed in ADMIN_EMAILS"""
+    if current_user.email.lower() not in config.ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+def get_user_loader() -> UserLoader:
+    """Request-scoped user loader shared by all response builders of a request"""
+    return UserLoader(db)
 
 # =============  SECURITY UTILITIES =============
 
@@ -250,6 +326,7 @@ async def create_or_get_oauth_user(oauth_data: Dict, ip_address: str, user_agent
         
         if update_data:
             await db.users.update_one({"id": existing_user["id"]}, {"$set": update_data})
+            user_cache.invalidate(existing_user["id"])
             
         # Get updated user data
         user_data = await db.users.find_one({"id": existing_user["id"]})
@@ -272,7 +349,8 @@ async def create_or_get_oauth_user(oauth_data: Dict, ip_address: str, user_agent
             avatar_url=oauth_data.get("picture"),
             oauth_provider="google",
             oauth_id=oauth_data.get("id"),
-            is_verified=True  # OAuth users are considered verified
+            is_verified=True,  # OAuth users are considered verified
+            **search_fields(username, oauth_data.get("name", email))
         )
         
         await db.users.insert_one(user.dict())
@@ -294,6 +372,23 @@ async def get_api_info():
         "features": ["messaging", "user_profiles"]
     }
 
+@api_router.get("/system/indexes")
+async def get_indexes_report(current_user: UserResponse = Depends(get_admin_user)):
+    """Report missing, undeclared and unused MongoDB indexes"""
+    return await get_index_report(db)
+
+@api_router.get("/system/stats")
+async def get_system_stats(current_user: UserResponse = Depends(get_admin_user)):
+    """Get in-process cache and worker pool counters"""
+    return {
+        "user_cache": user_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "counter_buffer": counter_buffer.stats(),
+        "pubsub": pubsub.stats(),
+        "unread_counter": unread_counter.stats(),
+        "follow_graph": follow_graph.stats()
+    }
+
 # =============  AUTHENTICATION ENDPOINTS =============
 
 @api_router.post("/auth/register", response_model=Token)
@@ -321,12 +416,13 @@ async def register(user_data: UserCreate, request: Request):
         )
     
     # Create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     user = User(
         email=user_data.email,
         username=user_data.username,
         display_name=user_data.display_name,
-        hashed_password=hashed_password
+        hashed_password=hashed_password,
+        **search_fields(user_data.username, user_data.display_name)
     )
     
     # Insert user
@@ -346,7 +442,7 @@ async def register(user_data: UserCreate, request: Request):
     await track_login_attempt(user_data.email, ip_address, user_agent, True)
     
     # Generate token
-    access_token = create_access_token(data={"sub": user.id})
+    access_token = create_user_access_token(user.dict())
     
     # Create session
     session_token = await create_session(user.id, device.id, ip_address, user_agent)
@@ -400,7 +496,7 @@ async def login(login_data: UserLogin, request: Request):
         )
     
     # Verify password (skip for OAuth users)
-    if user_data.get("hashed_password") and not verify_password(login_data.password, user_data["hashed_password"]):
+    if user_data.get("hashed_password") and not await password_hasher.verify(login_data.password, user_data["hashed_password"]):
         await track_login_attempt(
             login_data.email, ip_address, user_agent,
             False, "Invalid password"
@@ -441,12 +537,13 @@ async def login(login_data: UserLogin, request: Request):
         {"id": user_data["id"]},
         {"$set": {"last_login": datetime.utcnow()}}
     )
+    user_cache.invalidate(user_data["id"])
     
     # Track successful login
     await track_login_attempt(login_data.email, ip_address, user_agent, True)
     
     # Generate token
-    access_token = create_access_token(data={"sub": user_data["id"]})
+    access_token = create_user_access_token(user_data)
     
     # Create session
     session_token = await create_session(user_data["id"], device.id, ip_address, user_agent)
@@ -512,7 +609,7 @@ async def oauth_google_callback(session_id: str, request: Request):
         await track_login_attempt(user.email, ip_address, user_agent, True)
         
         # Generate JWT token
-        access_token = create_access_token(data={"sub": user.id})
+        access_token = create_user_access_token(user.dict())
         
         # Create session
         session_token = await create_session(user.id, device.id, ip_address, user_agent)
@@ -552,14 +649,17 @@ async def oauth_google_callback(session_id: str, request: Request):
 
 @api_router.get("/auth/security/notifications")
 async def get_security_notifications(
+    response: Response,
     current_user: UserResponse = Depends(get_current_user),
     limit: int = 20,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None
 ):
     """Get user's security notifications"""
-    notifications = await db.security_notifications.find({
-        "user_id": current_user.id
-    }).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
+    notifications = await find_page(
+        db.security_notifications, {"user_id": current_user.id},
+        limit, offset, cursor, response, {"_id": 0}
+    )
     
     return notifications
 
@@ -638,15 +738,17 @@ async def remove_device(
 
 @api_router.get("/auth/security/login-history")
 async def get_login_history(
+    response: Response,
     current_user: UserResponse = Depends(get_current_user),
     limit: int = 50,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None
 ):
     """Get user's recent login history"""
-    attempts = await db.login_attempts.find({
-        "email": current_user.email,
-        "success": True
-    }).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
+    attempts = await find_page(
+        db.login_attempts, {"email": current_user.email, "success": True},
+        limit, offset, cursor, response, {"_id": 0}
+    )
     
     return attempts
 
@@ -662,6 +764,8 @@ async def update_profile(
     
     if user_data.display_name is not None:
         update_fields["display_name"] = user_data.display_name.strip()
+        # Keep the search keys in sync with the new name
+        update_fields.update(search_fields(current_user.username, update_fields["display_name"]))
     if user_data.bio is not None:
         update_fields["bio"] = user_data.bio.strip()
     if user_data.avatar_url is not None:
@@ -679,6 +783,8 @@ async def update_profile(
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    user_cache.invalidate(current_user.id)
+    
     # Return updated user
     updated_user = await db.users.find_one({"id": current_user.id})
     return UserResponse(**updated_user)
@@ -706,11 +812,11 @@ async def change_password(
         )
     
     # Verify current password
-    if not verify_password(password_data.current_password, user_data["hashed_password"]):
+    if not await password_hasher.verify(password_data.current_password, user_data["hashed_password"]):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
     # Hash new password
-    new_hashed_password = get_password_hash(password_data.new_password)
+    new_hashed_password = await password_hasher.hash(password_data.new_password)
     
     # Update password in database
     result = await db.users.update_one(
@@ -721,6 +827,8 @@ async def change_password(
     if result.modified_count == 0:
         raise HTTPException(status_code=500, detail="Failed to update password")
     
+    user_cache.invalidate(current_user.id)
+    
     # Get device info
     device = await get_or_create_device(current_user.id, ip_address, user_agent)
     
@@ -769,6 +877,8 @@ async def update_settings(
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    user_cache.invalidate(current_user.id)
+    
     # Return updated user
     updated_user = await db.users.find_one({"id": current_user.id})
     return UserResponse(**updated_user)
@@ -800,26 +910,24 @@ async def get_user_profile(user_id: str):
 
 # =============  USER SEARCH ENDPOINTS =============
 
-@api_router.get("/users/search")
-async def search_users(q: str = "", current_user: UserResponse = Depends(get_current_user)):
-    """Search users by username or display name"""
-    if not q.strip():
-        return []
-    
-    # Search by username or display_name (case-insensitive)
-    search_regex = {"$regex": q, "$options": "i"}
-    users = await db.users.find({
-        "$and": [
-            {"id": {"$ne": current_user.id}},  # Exclude current user
-            {
-                "$or": [
-                    {"username": search_regex},
-                    {"display_name": search_regex}
-                ]
-            }
-        ]
-    }).limit(10).to_list(10)
-    
+@api_router.get("/users/search", response_model=List[UserResponse])
+async def search_users(
+    response: Response,
+    q: str = "",
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Search users by username or display name prefix.
+
+    Exact username matches come first, then username prefixes, then
+    display-name prefixes, each ranked by follower count. The next page
+    cursor is returned in the X-Next-Cursor header.
+    """
+    limit = max(1, min(limit, config.MAX_PAGE_SIZE))
+    users, next_page = await find_users(db, q, limit, cursor, exclude_user_id=current_user.id)
+    if next_page:
+        response.headers[NEXT_CURSOR_HEADER] = next_page
     return [UserResponse(**user) for user in users]
 
 # =============  FOLLOW ENDPOINTS =============
@@ -828,7 +936,7 @@ async def search_users(q: str = "", current_user: UserResponse = Depends(get_cur
 async def follow_user(user_id: str, current_user: UserResponse = Depends(get_current_user)):
     """Follow a user"""
     # Check if user to follow exists
-    user_to_follow = await db.users.find_one({"id": user_id})
+    user_to_follow = await db.users.find_one({"id": user_id}, {"_id": 1})
     if not user_to_follow:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -836,38 +944,29 @@ async def follow_user(user_id: str, current_user: UserResponse = Depends(get_cur
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
     
-    # Check if already following
-    existing_follow = await db.follows.find_one({
-        "follower_id": current_user.id,
-        "following_id": user_id
-    })
-    if existing_follow:
-        raise HTTPException(status_code=400, detail="Already following this user")
-    
-    # Create follow relationship
+    # Create follow relationship; the unique index rejects duplicates
     follow_data = Follow(
         follower_id=current_user.id,
         following_id=user_id
     )
     
-    result = await db.follows.insert_one(follow_data.model_dump())
-    if not result.inserted_id:
-        raise HTTPException(status_code=500, detail="Failed to follow user")
+    if not await follow_graph.follow(follow_data.model_dump()):
+        raise HTTPException(status_code=400, detail="Already following this user")
+    
+    invalidate_followees(current_user.id)
+    await add_author_to_timeline(db, current_user.id, user_id)
     
     return {"message": "Successfully followed user", "follow_id": follow_data.id}
 
 @api_router.delete("/users/{user_id}/follow")
 async def unfollow_user(user_id: str, current_user: UserResponse = Depends(get_current_user)):
     """Unfollow a user"""
-    # Find and delete follow relationship
-    result = await db.follows.delete_one({
-        "follower_id": current_user.id,
-        "following_id": user_id
-    })
-    
-    if result.deleted_count == 0:
+    if not await follow_graph.unfollow(current_user.id, user_id):
         raise HTTPException(status_code=404, detail="Follow relationship not found")
     
+    invalidate_followees(current_user.id)
+    await remove_author_from_timeline(db, current_user.id, user_id)
+    
     return {"message": "Successfully unfollowed user"}
 
 @api_router.get("/users/{user_id}/follow-status")
@@ -883,85 +982,238 @@ async def get_follow_status(user_id: str, current_user: UserResponse = Depends(g
         follow_id=follow_relationship["id"] if follow_relationship else None
     )
 
+@api_router.post("/users/follow-status:batch", response_model=FollowStatusBatch)
+async def get_follow_status_batch(
+    request_data: FollowStatusBatchRequest,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get follow status for many users with one indexed query"""
+    if len(request_data.user_ids) > config.FOLLOW_STATUS_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {config.FOLLOW_STATUS_BATCH_MAX_IDS} user ids per request"
+        )
+    
+    follow_ids = await follow_graph.follow_ids(current_user.id, request_data.user_ids)
+    
+    return FollowStatusBatch(statuses={
+        user_id: FollowStatus(
+            is_following=user_id in follow_ids,
+            follow_id=follow_ids.get(user_id)
+        )
+        for user_id in request_data.user_ids
+    })
+
+async def load_follow_page(
+    user_ids: List[str],
+    next_page: Optional[str],
+    response: Response,
+    users: UserLoader
+) -> List[UserResponse]:
+    """Hydrate one page of a follow list and advertise the next cursor"""
+    if next_page:
+        response.headers[NEXT_CURSOR_HEADER] = next_page
+    users_by_id = await users.load_responses(user_ids)
+    return [users_by_id[uid] for uid in user_ids if uid in users_by_id]
+
 @api_router.get("/users/following")
-async def get_following_users(current_user: UserResponse = Depends(get_current_user)):
+async def get_following_users(
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    current_user: UserResponse = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader)
+):
     """Get list of users that current user is following"""
-    follows = await db.follows.find({"follower_id": current_user.id}).to_list(1000)
-    
-    following_ids = [follow["following_id"] for follow in follows]
-    users = await db.users.find({"id": {"$in": following_ids}}).to_list(1000)
+    limit = min(limit, config.FOLLOW_LIST_MAX_PAGE_SIZE)
+    following_ids, next_page = await follow_graph.following_page(current_user.id, limit, cursor)
+    following = await load_follow_page(following_ids, next_page, response, users)
+    counts = await follow_graph.counts([current_user.id])
     
     return FollowingList(
-        following=[UserResponse(**user) for user in users],
-        total=len(users)
+        following=following,
+        total=counts.get(current_user.id, (0, 0))[1],
+        next_cursor=next_page
+    )
+
+@api_router.get("/users/suggestions", response_model=FollowSuggestions)
+async def get_follow_suggestions(
+    background_tasks: BackgroundTasks,
+    limit: int = 20,
+    current_user: UserResponse = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader)
+):
+    """Get precomputed "who to follow" suggestions.
+    
+    Suggestions older than SUGGESTIONS_MAX_AGE_SECONDS are still served,
+    flagged as stale, and recomputed in the background. Users followed since
+    they were computed are filtered out.
+    """
+    stored, stale = await follow_suggestions.get_suggestions(db, current_user.id)
+    if stored is None:
+        # First request: compute them now for this user
+        await follow_suggestions.refresh_suggestions(db, [current_user.id])
+        stored, stale = await follow_suggestions.get_suggestions(db, current_user.id)
+    elif stale:
+        background_tasks.add_task(follow_suggestions.refresh_suggestions, db, [current_user.id])
+    
+    items = stored["suggestions"] if stored else []
+    following = await follow_graph.follows_many(current_user.id, [item["user_id"] for item in items])
+    items = [item for item in items if not following.get(item["user_id"])][:limit]
+    users_by_id = await users.load_responses(item["user_id"] for item in items)
+    
+    return FollowSuggestions(
+        suggestions=[
+            SuggestedUser(user=users_by_id[item["user_id"]], **{k: v for k, v in item.items() if k != "user_id"})
+            for item in items
+            if item["user_id"] in users_by_id
+        ],
+        computed_at=stored["computed_at"] if stored else None,
+        stale=stale
     )
 
 @api_router.get("/users/{user_id}/followers")
-async def get_user_followers(user_id: str):
+async def get_user_followers(
+    user_id: str,
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    users: UserLoader = Depends(get_user_loader)
+):
     """Get list of users following the specified user"""
-    follows = await db.follows.find({"following_id": user_id}).to_list(1000)
-    
-    follower_ids = [follow["follower_id"] for follow in follows]
-    users = await db.users.find({"id": {"$in": follower_ids}}).to_list(1000)
+    limit = min(limit, config.FOLLOW_LIST_MAX_PAGE_SIZE)
+    follower_ids, next_page = await follow_graph.followers_page(user_id, limit, cursor)
+    followers = await load_follow_page(follower_ids, next_page, response, users)
+    counts = await follow_graph.counts([user_id])
     
     return FollowersList(
-        followers=[UserResponse(**user) for user in users],
-        total=len(users)
+        followers=followers,
+        total=counts.get(user_id, (0, 0))[0],
+        next_cursor=next_page
     )
 
 @api_router.get("/users/{user_id}/following")
-async def get_user_following(user_id: str):
+async def get_user_following(
+    user_id: str,
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    users: UserLoader = Depends(get_user_loader)
+):
     """Get list of users that specified user is following"""
-    follows = await db.follows.find({"follower_id": user_id}).to_list(1000)
-    
-    following_ids = [follow["following_id"] for follow in follows]
-    users = await db.users.find({"id": {"$in": following_ids}}).to_list(1000)
+    limit = min(limit, config.FOLLOW_LIST_MAX_PAGE_SIZE)
+    following_ids, next_page = await follow_graph.following_page(user_id, limit, cursor)
+    following = await load_follow_page(following_ids, next_page, response, users)
+    counts = await follow_graph.counts([user_id])
     
     return FollowingList(
-        following=[UserResponse(**user) for user in users],
-        total=len(users)
+        following=following,
+        total=counts.get(user_id, (0, 0))[1],
+        next_cursor=next_page
     )
 
 # =============  MESSAGING ENDPOINTS =============
 
+def conversation_pair_key(user_a: str, user_b: str) -> str:
+    """Canonical key of the one-to-one conversation between two users"""
+    return ":".join(sorted((user_a, user_b)))
+
+def message_position(message: dict) -> tuple:
+    """Sort key of a message (or read watermark) within its conversation"""
+    return (message["created_at"], message["id"])
+
+async def publish_event(user_id: str, event_type: str, data: dict):
+    """Push an event to every open WebSocket of a user"""
+    await pubsub.publish(user_channel(user_id), {"type": event_type, "data": jsonable_encoder(data)})
+
+async def publish_unread_count(user_id: str, unread_count: int):
+    """Push a user's new total unread count, if they are connected"""
+    if pubsub.is_subscribed(user_channel(user_id)):
+        await publish_event(user_id, UNREAD_COUNT, {"unread_count": unread_count})
+
+@api_router.websocket("/ws")
+async def websocket_events(websocket: WebSocket, token: str):
+    """Stream real-time events (new messages, read receipts, unread counts).
+    
+    Browsers cannot set headers on WebSocket requests, so the access token
+    is passed as the `token` query parameter. Clients may send
+    {"type": "ping"} to keep the connection alive.
+    """
+    try:
+        user = await get_user_from_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    subscription = await pubsub.subscribe(user_channel(user.id))
+    
+    async def forward_events():
+        while True:
+            await websocket.send_json(await subscription.get())
+    
+    sender = asyncio.ensure_future(forward_events())
+    try:
+        while True:
+            data = await websocket.receive_json()
+            if isinstance(data, dict) and data.get("type") == "ping":
+                # Reply through the queue so only one task writes to the socket
+                subscription.deliver({"type": "pong"})
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        sender.cancel()
+        try:
+            # Retrieve the forwarder's outcome, e.g. a send on a closed socket
+            await sender
+        except (asyncio.CancelledError, Exception):
+            pass
+        await pubsub.unsubscribe(subscription)
+
 @api_router.post("/messages")
-async def send_message(message: MessageCreate, current_user: UserResponse = Depends(get_current_user)):
+async def send_message(
+    message: MessageCreate,
+    background_tasks: BackgroundTasks,
+    current_user: UserResponse = Depends(get_current_user)
+):
     """Send a message to another user"""
     # Verify recipient exists
-    recipient = await db.users.find_one({"id": message.recipient_id})
+    recipient = await db.users.find_one({"id": message.recipient_id}, {"_id": 1})
     if not recipient:
         raise HTTPException(status_code=404, detail="Recipient not found")
     
-    # Find or create conversation
-    conversation_data = await db.conversations.find_one({
-        "participants": {"$all": [current_user.id, message.recipient_id]}
-    })
-    
-    if not conversation_data:
-        # Create new conversation
-        conversation = Conversation(
-            participants=[current_user.id, message.recipient_id],
-            unread_count={
-                current_user.id: 0,
-                message.recipient_id: 1
-            }
-        )
-        await db.conversations.insert_one(conversation.dict())
-        conversation_id = conversation.id
-    else:
-        conversation_id = conversation_data["id"]
-        # Update unread count for recipient
-        await db.conversations.update_one(
-            {"id": conversation_id},
-            {
-                "$inc": {f"unread_count.{message.recipient_id}": 1},
-                "$set": {
-                    "last_message": message.content,
-                    "last_message_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
+    # Find or create the conversation in one upsert on its unique pair key
+    now = datetime.utcnow()
+    conversation = Conversation(
+        participants=[current_user.id, message.recipient_id],
+        pair_key=conversation_pair_key(current_user.id, message.recipient_id)
+    )
+    for attempt in range(2):
+        try:
+            conversation_data = await db.conversations.find_one_and_update(
+                {"pair_key": conversation.pair_key},
+                {
+                    "$setOnInsert": conversation.dict(
+                        exclude={"last_message", "last_message_at", "unread_count", "updated_at"}
+                    ),
+                    # Update unread count for recipient
+                    "$inc": {f"unread_count.{message.recipient_id}": 1},
+                    "$set": {
+                        "last_message": message.content,
+                        "last_message_at": now,
+                        "updated_at": now
+                    }
+                },
+                upsert=True,
+                projection={"_id": 0, "id": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            break
+        except DuplicateKeyError:
+            # A concurrent first message created it; retry as an update
+            if attempt:
+                raise
+    conversation_id = conversation_data["id"]
     
     # Create message
     new_message = Message(
@@ -974,6 +1226,14 @@ async def send_message(message: MessageCreate, current_user: UserResponse = Depe
     )
     
     await db.messages.insert_one(new_message.dict())
+    unread_total = await unread_counter.change(message.recipient_id, 1)
+    
+    # Push to the recipient and to the sender's other sessions
+    for user_id in (message.recipient_id, current_user.id):
+        background_tasks.add_task(
+            publish_event, user_id, MESSAGE_NEW, new_message.dict()
+        )
+    background_tasks.add_task(publish_unread_count, message.recipient_id, unread_total)
     
     return {
         "success": True,
@@ -981,24 +1241,51 @@ async def send_message(message: MessageCreate, current_user: UserResponse = Depe
         "conversation_id": conversation_id
     }
 
-@api_router.get("/conversations")
-async def get_conversations(current_user: UserResponse = Depends(get_current_user)):
-    """Get user's conversations"""
-    conversations = await db.conversations.find({
-        "participants": current_user.id,
-        "is_active": True
-    }).sort("last_message_at", -1).to_list(50)
+@api_router.get("/conversations", response_model=List[ConversationResponse])
+async def get_conversations(
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    current_user: UserResponse = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader)
+):
+    """Get user's conversations, most recent first.
+    
+    Pages are keyset-paginated on (last_message_at, id); the next page is
+    advertised in the X-Next-Cursor header. One query loads the page and one
+    more loads every participant.
+    """
+    conversations = await db.conversations.find(
+        apply_cursor(
+            {"participants": current_user.id, "is_active": True},
+            cursor,
+            field="last_message_at"
+        ),
+        {
+            "_id": 0,
+            "id": 1,
+            "participants": 1,
+            "last_message": 1,
+            "last_message_at": 1,
+            f"unread_count.{current_user.id}": 1,
+            "created_at": 1
+        }
+    ).sort([("last_message_at", -1), ("id", -1)]).limit(limit).to_list(limit)
+    
+    cursor_for_next = next_cursor(conversations, limit, field="last_message_at")
+    if cursor_for_next:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_for_next
+    
+    # Get participant info for every conversation at once
+    users_by_id = await users.load_responses(
+        p for conv_data in conversations for p in conv_data["participants"]
+        if p != current_user.id
+    )
     
     result = []
     for conv_data in conversations:
-        # Get participant info
         participant_ids = [p for p in conv_data["participants"] if p != current_user.id]
-        participants = []
-        
-        for participant_id in participant_ids:
-            user_data = await db.users.find_one({"id": participant_id})
-            if user_data:
-                participants.append(UserResponse(**user_data))
+        participants = [users_by_id[p] for p in participant_ids if p in users_by_id]
         
         # Get unread count for current user
         unread_count = conv_data.get("unread_count", {}).get(current_user.id, 0)
@@ -1018,61 +1305,195 @@ async def get_conversations(current_user: UserResponse = Depends(get_current_use
 @api_router.get("/conversations/{conversation_id}/messages")
 async def get_conversation_messages(
     conversation_id: str,
+    background_tasks: BackgroundTasks,
+    response: Response,
     limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     current_user: UserResponse = Depends(get_current_user)
 ):
-    """Get messages from a conversation"""
+    """Get messages from a conversation in chronological order.
+    
+    Without cursors the latest page is returned. `before` pages back through
+    older messages and `after` fetches newer ones, using the cursors from the
+    X-Before-Cursor and X-After-Cursor headers. Reading moves the caller's
+    read watermark to the newest message returned; nothing is written when
+    the watermark does not move.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    
     # Verify user is participant in conversation
     conversation = await db.conversations.find_one({
         "id": conversation_id,
         "participants": current_user.id
-    })
+    }, {"_id": 0, "id": 1, "participants": 1, "read_watermarks": 1})
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     # Get messages
-    messages = await db.messages.find({
-        "conversation_id": conversation_id
-    }).sort("created_at", -1).limit(limit).to_list(limit)
-    
-    # Mark messages as read
-    await db.messages.update_many(
-        {
-            "conversation_id": conversation_id,
-            "recipient_id": current_user.id,
-            "is_read": False
-        },
-        {"$set": {"is_read": True}}
-    )
-    
-    # Reset unread count for current user
-    await db.conversations.update_one(
-        {"id": conversation_id},
-        {"$set": {f"unread_count.{current_user.id}": 0}}
-    )
+    if after:
+        messages = await db.messages.find(
+            apply_cursor({"conversation_id": conversation_id}, after, ascending=True)
+        ).sort(CURSOR_SORT_ASC).limit(limit).to_list(limit)
+    else:
+        messages = await db.messages.find(
+            apply_cursor({"conversation_id": conversation_id}, before)
+        ).sort(CURSOR_SORT).limit(limit).to_list(limit)
+        # Reverse to get chronological order (oldest first)
+        messages.reverse()
+    
+    if messages:
+        response.headers[AFTER_CURSOR_HEADER] = encode_cursor(messages[-1])
+        if after or len(messages) == limit:
+            response.headers[BEFORE_CURSOR_HEADER] = encode_cursor(messages[0])
+    
+    # Advance the read watermark to the newest message returned
+    watermarks = conversation.get("read_watermarks", {})
+    current_mark = watermarks.get(current_user.id)
+    newest = messages[-1] if messages else None
+    if newest and (not current_mark or message_position(newest) > message_position(current_mark)):
+        new_mark = {"id": newest["id"], "created_at": newest["created_at"]}
+        
+        # The latest page leaves nothing unread; older or newer pages may not
+        remaining = 0
+        if before or after:
+            remaining = await db.messages.count_documents({
+                "conversation_id": conversation_id,
+                "recipient_id": current_user.id,
+                "$or": [
+                    {"created_at": {"$gt": newest["created_at"]}},
+                    {"created_at": newest["created_at"], "id": {"$gt": newest["id"]}}
+                ]
+            })
+        
+        # Only advance from the mark we read, so concurrent reads never move it back
+        previous = await db.conversations.find_one_and_update(
+            {"id": conversation_id, f"read_watermarks.{current_user.id}": current_mark},
+            {"$set": {
+                f"read_watermarks.{current_user.id}": new_mark,
+                f"unread_count.{current_user.id}": remaining
+            }},
+            projection={"_id": 0, f"unread_count.{current_user.id}": 1}
+        )
+        
+        # Send a read receipt to the participants and the reader's new unread total
+        if previous is not None:
+            was_unread = previous.get("unread_count", {}).get(current_user.id, 0)
+            if remaining != was_unread:
+                unread_total = await unread_counter.change(current_user.id, remaining - was_unread)
+            else:
+                unread_total = await unread_counter.get(current_user.id)
+            watermarks = {**watermarks, current_user.id: new_mark}
+            receipt = {
+                "conversation_id": conversation_id,
+                "reader_id": current_user.id,
+                "message_id": newest["id"],
+                "read_at": datetime.utcnow()
+            }
+            for participant_id in conversation["participants"]:
+                background_tasks.add_task(publish_event, participant_id, CONVERSATION_READ, receipt)
+            background_tasks.add_task(publish_unread_count, current_user.id, unread_total)
     
-    # Reverse to get chronological order (oldest first)
-    messages.reverse()
+    # A message is read once its recipient's watermark has passed it
+    for msg in messages:
+        recipient_mark = watermarks.get(msg["recipient_id"])
+        if recipient_mark and message_position(msg) <= message_position(recipient_mark):
+            msg["is_read"] = True
     
     return [Message(**msg) for msg in messages]
 
 @api_router.get("/messages/unread")
 async def get_unread_count(current_user: UserResponse = Depends(get_current_user)):
     """Get total unread message count"""
-    conversations = await db.conversations.find({
-        "participants": current_user.id,
-        "is_active": True
-    }).to_list(100)
-    
-    total_unread = sum(
-        conv.get("unread_count", {}).get(current_user.id, 0) 
-        for conv in conversations
+    return {"unread_count": await unread_counter.get(current_user.id)}
+
+# =============  COMMENT ENDPOINTS =============
+
+def build_comment_response(comment_data: dict, **fields) -> CommentResponse:
+    """Build a CommentResponse, letting explicit fields override stored ones"""
+    return CommentResponse(**{**comment_data, **fields})
+
+async def build_comment_tree(
+    comments: List[dict],
+    current_user: UserResponse,
+    users: UserLoader,
+    replies_limit: int,
+    depth: int
+) -> List[CommentResponse]:
+    """Hydrate a page of comments plus the first replies of each node.
+    
+    Each level costs one aggregation that loads the first replies_limit
+    replies of every node on it, and expansion stops once COMMENT_MAX_REPLIES comments are
+    loaded. Authors and the viewer's likes for the whole tree are then
+    fetched in one query each. Nodes with more replies than were loaded get a
+    replies_cursor for GET /comments/{id}/replies.
+    """
+    children: Dict[str, List[dict]] = {}
+    level = comments
+    all_comments = list(comments)
+    for _ in range(depth):
+        # Older comments without a stored count are queried anyway
+        parents = [comment for comment in level if comment.get("reply_count") != 0]
+        if not parents or len(all_comments) >= config.COMMENT_MAX_REPLIES:
+            break
+        # One aggregation per level: the first replies_limit replies of every parent
+        grouped = await db.comments.aggregate([
+            {"$match": {"parent_comment_id": {"$in": [parent["id"] for parent in parents]}}},
+            {"$sort": {"parent_comment_id": 1, "created_at": 1, "id": 1}},
+            {"$group": {"_id": "$parent_comment_id", "replies": {"$push": "$$ROOT"}}},
+            {"$project": {"replies": {"$slice": ["$replies", replies_limit]}}},
+        ]).to_list(None)
+        replies_by_parent = {group["_id"]: group["replies"] for group in grouped}
+        level = []
+        for parent in parents:
+            replies = replies_by_parent.get(parent["id"], [])
+            children[parent["id"]] = replies
+            level.extend(replies)
+        all_comments.extend(level)
+    
+    comment_ids = [comment["id"] for comment in all_comments]
+    users_dict, user_likes = await asyncio.gather(
+        users.load_responses(comment["user_id"] for comment in all_comments),
+        db.comment_likes.find(
+            {"comment_id": {"$in": comment_ids}, "user_id": current_user.id},
+            {"comment_id": 1}
+        ).to_list(len(comment_ids))
     )
+    liked_comments = set(like["comment_id"] for like in user_likes)
     
-    return {"unread_count": total_unread}
+    def build(comment_data: dict) -> Optional[CommentResponse]:
+        user = users_dict.get(comment_data["user_id"])
+        if not user:
+            return None
+        comment_data = counter_buffer.merge("comments", comment_data)
+        loaded = children.get(comment_data["id"], [])
+        replies = [reply for reply in (build(child) for child in loaded) if reply]
+        stored_count = comment_data.get("reply_count")
+        if stored_count is None:
+            # Without a stored count a full page may have more behind it
+            has_more = len(loaded) == replies_limit
+        else:
+            has_more = bool(loaded) and stored_count > len(loaded)
+        return build_comment_response(
+            comment_data,
+            user=user,
+            replies=replies,
+            reply_count=comment_data.get("reply_count", len(loaded)),
+            user_liked=comment_data["id"] in liked_comments,
+            replies_cursor=encode_cursor(loaded[-1]) if has_more else None
+        )
+    
+    return [response for response in (build(comment) for comment in comments) if response]
 
-# =============  COMMENT ENDPOINTS =============
+def clamp_tree_params(limit: int, replies_limit: int, depth: int) -> tuple:
+    """Bound the page size, replies per node and depth of a comment tree request"""
+    return (
+        max(1, min(limit, config.MAX_PAGE_SIZE)),
+        max(1, min(replies_limit, config.COMMENT_TREE_MAX_REPLIES_PER_NODE)),
+        max(0, min(depth, config.COMMENT_MAX_REPLY_DEPTH)),
+    )
 
 @api_router.post("/polls/{poll_id}/comments", response_model=CommentResponse)
 async def create_comment(
@@ -1086,28 +1507,35 @@ async def create_comment(
         raise HTTPException(status_code=400, detail="Poll ID mismatch")
     
     # Si es una respuesta, verificar que el comentario padre existe
+    parent_comment = None
     if comment_data.parent_comment_id:
         parent_comment = await db.comments.find_one({
             "id": comment_data.parent_comment_id,
             "poll_id": poll_id
-        })
+        }, PATH_PROJECTION)
         if not parent_comment:
             raise HTTPException(status_code=404, detail="Parent comment not found")
     
-    # Crear el comentario
+    # Crear el comentario con su ruta de ancestros
     comment = Comment(
         poll_id=poll_id,
         user_id=current_user.id,
         content=comment_data.content.strip(),
-        parent_comment_id=comment_data.parent_comment_id
+        parent_comment_id=comment_data.parent_comment_id,
+        **child_path(parent_comment)
     )
     
     # Insertar en la base de datos
     await db.comments.insert_one(comment.dict())
     
+    # Mantener el conteo de respuestas directas del padre y el de la encuesta
+    if comment.parent_comment_id:
+        await adjust_reply_count(db, comment.parent_comment_id, 1)
+    await db.polls.update_one({"id": poll_id}, {"$inc": {"comments_count": 1}})
+    
     # Retornar el comentario creado con información del usuario
-    return CommentResponse(
-        **comment.dict(),
+    return build_comment_response(
+        comment.dict(),
         user=current_user,
         replies=[],
         reply_count=0,
@@ -1119,7 +1547,8 @@ async def get_poll_comments(
     poll_id: str,
     limit: int = 50,
     offset: int = 0,
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader)
 ):
     """Get comments for a specific poll with nested structure"""
     
@@ -1129,15 +1558,13 @@ async def get_poll_comments(
     }).sort("created_at", 1)  # Orden cronológico
     
     all_comments = await comments_cursor.to_list(1000)  # Límite alto para obtener todos
+    all_comments = [counter_buffer.merge("comments", comment) for comment in all_comments]
     
     if not all_comments:
         return []
     
     # Obtener información de usuarios únicos
-    user_ids = list(set(comment["user_id"] for comment in all_comments))
-    users_cursor = db.users.find({"id": {"$in": user_ids}})
-    users_list = await users_cursor.to_list(len(user_ids))
-    users_dict = {user["id"]: UserResponse(**user) for user in users_list}
+    users_dict = await users.load_responses(comment["user_id"] for comment in all_comments)
     
     # Obtener likes del usuario actual para cada comentario
     comment_ids = [comment["id"] for comment in all_comments]
@@ -1154,8 +1581,8 @@ async def get_poll_comments(
     
     # Construir estructura anidada
     for comment_data in all_comments:
-        comment_resp = CommentResponse(
-            **comment_data,
+        comment_resp = build_comment_response(
+            comment_data,
             user=users_dict.get(comment_data["user_id"]),
             replies=[],
             reply_count=0,
@@ -1191,6 +1618,56 @@ async def get_poll_comments(
     
     return paginated_comments
 
+@api_router.get("/polls/{poll_id}/comments/tree", response_model=List[CommentResponse])
+async def get_poll_comment_tree(
+    poll_id: str,
+    response: Response,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    replies_limit: int = 3,
+    depth: int = 2,
+    current_user: UserResponse = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader)
+):
+    """Get one page of root comments with the first replies of each node.
+    
+    The next page of root comments is advertised in the X-Next-Cursor header
+    and each node's replies_cursor continues its replies.
+    """
+    limit, replies_limit, depth = clamp_tree_params(limit, replies_limit, depth)
+    roots = await db.comments.find(
+        apply_cursor({"poll_id": poll_id, "parent_comment_id": None}, cursor, ascending=True)
+    ).sort(CURSOR_SORT_ASC).limit(limit).to_list(limit)
+    
+    cursor_for_next = next_cursor(roots, limit)
+    if cursor_for_next:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_for_next
+    
+    return await build_comment_tree(roots, current_user, users, replies_limit, depth)
+
+@api_router.get("/comments/{comment_id}/replies", response_model=List[CommentResponse])
+async def get_comment_replies(
+    comment_id: str,
+    response: Response,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    replies_limit: int = 3,
+    depth: int = 1,
+    current_user: UserResponse = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader)
+):
+    """Load more replies of a comment, oldest first"""
+    limit, replies_limit, depth = clamp_tree_params(limit, replies_limit, depth)
+    replies = await db.comments.find(
+        apply_cursor({"parent_comment_id": comment_id}, cursor, ascending=True)
+    ).sort(CURSOR_SORT_ASC).limit(limit).to_list(limit)
+    
+    cursor_for_next = next_cursor(replies, limit)
+    if cursor_for_next:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_for_next
+    
+    return await build_comment_tree(replies, current_user, users, replies_limit, depth)
+
 @api_router.put("/comments/{comment_id}", response_model=CommentResponse)
 async def update_comment(
     comment_id: str,
@@ -1226,8 +1703,8 @@ async def update_comment(
     # Obtener el comentario actualizado
     updated_comment = await db.comments.find_one({"id": comment_id})
     
-    return CommentResponse(
-        **updated_comment,
+    return build_comment_response(
+        updated_comment,
         user=current_user,
         replies=[],
         reply_count=0,
@@ -1250,26 +1727,14 @@ async def delete_comment(
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found or not authorized")
     
-    # Eliminar el comentario y todas sus respuestas recursivamente
-    await delete_comment_recursive(comment_id)
-    
-    return {"message": "Comment deleted successfully"}
-
-async def delete_comment_recursive(comment_id: str):
-    """Función auxiliar para eliminar comentarios de forma recursiva"""
-    
-    # Encontrar todos los comentarios hijos
-    child_comments = await db.comments.find({"parent_comment_id": comment_id}).to_list(1000)
-    
-    # Eliminar recursivamente los comentarios hijos
-    for child in child_comments:
-        await delete_comment_recursive(child["id"])
+    # Eliminar el comentario, todas sus respuestas y sus likes en bloque
+    deleted_ids = await delete_subtree(db, comment)
+    await db.polls.update_one({"id": comment["poll_id"]}, {"$inc": {"comments_count": -len(deleted_ids)}})
     
-    # Eliminar likes del comentario
-    await db.comment_likes.delete_many({"comment_id": comment_id})
+    if comment.get("parent_comment_id"):
+        await adjust_reply_count(db, comment["parent_comment_id"], -1)
     
-    # Eliminar el comentario principal
-    await db.comments.delete_one({"id": comment_id})
+    return {"message": "Comment deleted successfully"}
 
 @api_router.post("/comments/{comment_id}/like")
 async def toggle_comment_like(
@@ -1278,117 +1743,80 @@ async def toggle_comment_like(
 ):
     """Toggle like on a comment"""
     
-    # Verificar que el comentario existe
-    comment = await db.comments.find_one({"id": comment_id})
-    if not comment:
-        raise HTTPException(status_code=404, detail="Comment not found")
+    like = CommentLike(
+        comment_id=comment_id,
+        user_id=current_user.id
+    )
     
-    # Verificar si ya existe el like
-    existing_like = await db.comment_likes.find_one({
-        "comment_id": comment_id,
-        "user_id": current_user.id
-    })
+    # Agregar o quitar el like y obtener el nuevo conteo en un solo paso
+    toggled = await toggle_counted_membership(
+        counter_buffer,
+        "comment_likes", like.dict(), {"comment_id": comment_id, "user_id": current_user.id},
+        "comments", {"id": comment_id}, "likes"
+    )
+    if toggled is None:
+        raise HTTPException(status_code=404, detail="Comment not found")
     
-    if existing_like:
-        # Quitar like
-        await db.comment_likes.delete_one({
-            "comment_id": comment_id,
-            "user_id": current_user.id
-        })
-        
-        # Decrementar contador de likes
-        await db.comments.update_one(
-            {"id": comment_id},
-            {"$inc": {"likes": -1}}
-        )
-        
-        # Obtener nuevo conteo
-        updated_comment = await db.comments.find_one({"id": comment_id})
-        
-        return {
-            "liked": False,
-            "likes": updated_comment["likes"]
-        }
-    else:
-        # Agregar like
-        like = CommentLike(
-            comment_id=comment_id,
-            user_id=current_user.id
-        )
-        
-        await db.comment_likes.insert_one(like.dict())
-        
-        # Incrementar contador de likes
-        await db.comments.update_one(
-            {"id": comment_id},
-            {"$inc": {"likes": 1}}
-        )
-        
-        # Obtener nuevo conteo
-        updated_comment = await db.comments.find_one({"id": comment_id})
-        
-        return {
-            "liked": True,
-            "likes": updated_comment["likes"]
-        }
+    liked, likes = toggled
+    return {
+        "liked": liked,
+        "likes": likes
+    }
 
 @api_router.get("/comments/{comment_id}")
 async def get_comment(
     comment_id: str,
-    current_user: UserResponse = Depends(get_current_user)
+    depth: Optional[int] = None,
+    current_user: UserResponse = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader)
 ):
-    """Get a specific comment with its replies"""
+    """Get a specific comment with its replies up to `depth` levels below it"""
+    
+    depth = min(max(depth if depth is not None else config.COMMENT_REPLY_DEPTH, 0), config.COMMENT_MAX_REPLY_DEPTH)
     
     comment = await db.comments.find_one({"id": comment_id})
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    # Obtener información del usuario
-    user_data = await db.users.find_one({"id": comment["user_id"]})
-    if not user_data:
-        raise HTTPException(status_code=404, detail="Comment author not found")
+    # Todas las respuestas hasta la profundidad pedida en una sola consulta
+    descendants = []
+    if depth:
+        descendants = await load_subtree(db, comment, depth, config.COMMENT_MAX_REPLIES)
+    
+    thread = [counter_buffer.merge("comments", item) for item in [comment] + descendants]
+    children: Dict[str, List[dict]] = {}
+    for item in thread[1:]:
+        children.setdefault(item["parent_comment_id"], []).append(item)
+    
+    # Autores y likes del usuario actual para todo el hilo en dos consultas
+    thread_ids = [item["id"] for item in thread]
+    users_dict, user_likes = await asyncio.gather(
+        users.load_responses(item["user_id"] for item in thread),
+        db.comment_likes.find(
+            {"comment_id": {"$in": thread_ids}, "user_id": current_user.id},
+            {"comment_id": 1}
+        ).to_list(len(thread_ids))
+    )
+    liked_comments = set(like["comment_id"] for like in user_likes)
     
-    user = UserResponse(**user_data)
+    if comment["user_id"] not in users_dict:
+        raise HTTPException(status_code=404, detail="Comment author not found")
     
-    # Verificar si el usuario actual le dio like
-    user_like = await db.comment_likes.find_one({
-        "comment_id": comment_id,
-        "user_id": current_user.id
-    })
+    def build(comment_data: dict) -> Optional[CommentResponse]:
+        user = users_dict.get(comment_data["user_id"])
+        if not user:
+            return None
+        loaded = children.get(comment_data["id"], [])
+        replies = [reply for reply in (build(child) for child in loaded) if reply]
+        return build_comment_response(
+            comment_data,
+            user=user,
+            replies=replies,
+            reply_count=comment_data.get("reply_count", len(loaded)),
+            user_liked=comment_data["id"] in liked_comments
+        )
     
-    # Obtener respuestas directas
-    replies_cursor = db.comments.find({
-        "parent_comment_id": comment_id
-    }).sort("created_at", 1)
-    
-    replies_data = await replies_cursor.to_list(100)
-    
-    # Procesar respuestas
-    replies = []
-    for reply_data in replies_data:
-        reply_user_data = await db.users.find_one({"id": reply_data["user_id"]})
-        if reply_user_data:
-            reply_user_like = await db.comment_likes.find_one({
-                "comment_id": reply_data["id"],
-                "user_id": current_user.id
-            })
-            
-            reply = CommentResponse(
-                **reply_data,
-                user=UserResponse(**reply_user_data),
-                replies=[],  # Por ahora solo 2 niveles
-                reply_count=0,
-                user_liked=bool(reply_user_like)
-            )
-            replies.append(reply)
-    
-    return CommentResponse(
-        **comment,
-        user=user,
-        replies=replies,
-        reply_count=len(replies),
-        user_liked=bool(user_like)
-    )
+    return build(thread[0])
 
 # =============  FILE UPLOAD UTILITIES =============
 
@@ -1623,9 +2051,11 @@ async def delete_upload(
 
 @api_router.get("/uploads/user", response_model=List[UploadResponse])
 async def get_user_uploads(
+    response: Response,
     upload_type: Optional[UploadType] = None,
     limit: int = 20,
     offset: int = 0,
+    cursor: Optional[str] = None,
     current_user: UserResponse = Depends(get_current_user)
 ):
     """Get user's uploaded files"""
@@ -1634,8 +2064,7 @@ async def get_user_uploads(
     if upload_type:
         filter_query["upload_type"] = upload_type
     
-    files_cursor = db.uploaded_files.find(filter_query).sort("created_at", -1).skip(offset).limit(limit)
-    files = await files_cursor.to_list(limit)
+    files = await find_page(db.uploaded_files, filter_query, limit, offset, cursor, response)
     
     return [UploadResponse(**file_data) for file_data in files]
 
@@ -1668,106 +2097,108 @@ def calculate_time_ago(created_at: datetime) -> str:
     
     return "hace unos momentos"
 
-@api_router.get("/polls", response_model=List[PollResponse])
-async def get_polls(
-    limit: int = 20,
-    offset: int = 0,
-    category: Optional[str] = None,
-    featured: Optional[bool] = None,
-    current_user: UserResponse = Depends(get_current_user)
-):
-    """Get polls with pagination and filters"""
-    
-    # Build filter query
-    filter_query = {"is_active": True}
-    if category:
-        filter_query["category"] = category
-    if featured is not None:
-        filter_query["is_featured"] = featured
-    
-    # Get polls
-    polls_cursor = db.polls.find(filter_query).sort("created_at", -1).skip(offset).limit(limit)
-    polls = await polls_cursor.to_list(limit)
+def format_count(count: int) -> str:
+    """Human-formatted count: 999, 1.2K, 15K, 3.4M (truncated, never rounded up)"""
+    if count < 1000:
+        return str(max(count, 0))
+    for divisor, suffix in ((1_000_000_000, "B"), (1_000_000, "M"), (1_000, "K")):
+        if count >= divisor:
+            value = count / divisor
+            if value >= 10:
+                return f"{int(value)}{suffix}"
+            return f"{math.floor(value * 10) / 10:g}{suffix}"
+
+def build_option_response(option: dict, option_user: dict, followers_count: int = 0) -> dict:
+    """Build the option dict returned to the frontend"""
+    # Keep media_url as relative path for frontend to handle
+    media_url = option.get("media_url")
     
+    return {
+        "id": option["id"],
+        "text": option["text"],
+        "votes": option["votes"],
+        "user": {
+            "username": option_user["username"],
+            "displayName": option_user["display_name"],
+            "avatar": option_user.get("avatar_url"),
+            "verified": option_user.get("is_verified", False),
+            "followers": format_count(followers_count)
+        },
+        "media": {
+            "type": option.get("media_type"),
+            "url": media_url,
+            "thumbnail": option.get("thumbnail_url") or media_url
+        } if media_url else None
+    }
+
+async def build_poll_responses(
+    polls: List[dict],
+    current_user: UserResponse,
+    users: UserLoader,
+    skip_incomplete: bool = True
+) -> List[PollResponse]:
+    """Hydrate a page of polls with a fixed number of queries.
+    
+    Authors and option owners for the whole page are fetched in one user
+    lookup, alongside one query each for the viewer's votes and likes.
+    Option owners' follower counts are the stored counts in those same
+    user documents (see migrate_follow_counts.py for older users).
+    """
     if not polls:
         return []
     
-    # Get all author IDs
-    author_ids = list(set(poll["author_id"] for poll in polls))
-    authors_cursor = db.users.find({"id": {"$in": author_ids}})
-    authors_list = await authors_cursor.to_list(len(author_ids))
-    authors_dict = {user["id"]: UserResponse(**user) for user in authors_list}
+    # Include counter increments that have not been flushed yet
+    polls = [counter_buffer.merge("polls", poll) for poll in polls]
     
-    # Get user votes and likes
     poll_ids = [poll["id"] for poll in polls]
-    
-    user_votes_cursor = db.votes.find({
-        "poll_id": {"$in": poll_ids},
-        "user_id": current_user.id
-    })
-    user_votes = await user_votes_cursor.to_list(len(poll_ids))
+    user_ids = [poll["author_id"] for poll in polls] + [
+        option["user_id"] for poll in polls for option in poll.get("options", [])
+    ]
+    
+    users_dict, user_votes, user_likes = await asyncio.gather(
+        users.load_many(user_ids),
+        db.votes.find(
+            {"poll_id": {"$in": poll_ids}, "user_id": current_user.id},
+            {"poll_id": 1, "option_id": 1}
+        ).to_list(len(poll_ids)),
+        db.poll_likes.find(
+            {"poll_id": {"$in": poll_ids}, "user_id": current_user.id},
+            {"poll_id": 1}
+        ).to_list(len(poll_ids))
+    )
     user_votes_dict = {vote["poll_id"]: vote["option_id"] for vote in user_votes}
-    
-    user_likes_cursor = db.poll_likes.find({
-        "poll_id": {"$in": poll_ids},
-        "user_id": current_user.id
-    })
-    user_likes = await user_likes_cursor.to_list(len(poll_ids))
     liked_poll_ids = set(like["poll_id"] for like in user_likes)
     
-    # Build response
     result = []
     for poll_data in polls:
-        # Get option users
-        option_user_ids = [option["user_id"] for option in poll_data.get("options", [])]
-        if option_user_ids:
-            option_users_cursor = db.users.find({"id": {"$in": option_user_ids}})
-            option_users_list = await option_users_cursor.to_list(len(option_user_ids))
-            option_users_dict = {user["id"]: user for user in option_users_list}
-        else:
-            option_users_dict = {}
+        author_data = users_dict.get(poll_data["author_id"])
+        if not author_data:
+            continue
         
-        # Process options
-        options = []
-        for option in poll_data.get("options", []):
-            option_user = option_users_dict.get(option["user_id"])
-            if option_user:
-                # Keep media_url as relative path for frontend to handle
-                media_url = option.get("media_url")
-                
-                option_dict = {
-                    "id": option["id"],
-                    "text": option["text"],
-                    "votes": option["votes"],
-                    "user": {
-                        "username": option_user["username"],
-                        "displayName": option_user["display_name"],
-                        "avatar": option_user.get("avatar_url"),
-                        "verified": option_user.get("is_verified", False),
-                        "followers": "1K"  # Placeholder
-                    },
-                    "media": {
-                        "type": option.get("media_type"),
-                        "url": media_url,
-                        "thumbnail": option.get("thumbnail_url") or media_url
-                    } if media_url else None
-                }
-                options.append(option_dict)
+        options = [
+            build_option_response(
+                option,
+                users_dict[option["user_id"]],
+                max(users_dict[option["user_id"]].get("followers_count", 0), 0)
+            )
+            for option in poll_data.get("options", [])
+            if option["user_id"] in users_dict
+        ]
         
         # Skip polls without valid options or without title
-        if not options or not poll_data.get("title"):
+        if skip_incomplete and (not options or not poll_data.get("title")):
             continue
         
-        poll_response = PollResponse(
+        result.append(PollResponse(
             id=poll_data["id"],
             title=poll_data["title"],
-            author=authors_dict.get(poll_data["author_id"]),
+            author=UserResponse(**author_data),
             description=poll_data.get("description"),
             options=options,
             total_votes=poll_data["total_votes"],
             likes=poll_data["likes"],
             shares=poll_data["shares"],
-            comments_count=poll_data["comments_count"],
+            comments_count=poll_data.get("comments_count", 0),
             music=None,  # TODO: Implement music system
             user_vote=user_votes_dict.get(poll_data["id"]),
             user_liked=poll_data["id"] in liked_poll_ids,
@@ -1776,16 +2207,62 @@ async def get_polls(
             category=poll_data.get("category"),
             created_at=poll_data["created_at"],
             time_ago=calculate_time_ago(poll_data["created_at"])
-        )
-        result.append(poll_response)
+        ))
     
     return result
+
+@api_router.get("/polls", response_model=List[PollResponse])
+async def get_polls(
+    response: Response,
+    limit: int = 20,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    featured: Optional[bool] = None,
+    feed: str = "global",
+    sort: str = "recent",
+    current_user: UserResponse = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader)
+):
+    """Get polls with pagination and filters.
     
-    return result
+    feed=following serves the user's precomputed home timeline instead of
+    the global feed, and sort=ranked orders the global feed by the ranking
+    engine instead of recency.
+    """
+    
+    if feed == "following":
+        polls, cursor_for_next = await read_timeline(db, current_user.id, limit, cursor)
+        if cursor_for_next:
+            response.headers[NEXT_CURSOR_HEADER] = cursor_for_next
+        return await build_poll_responses(polls, current_user, users)
+    
+    # Build filter query
+    filter_query = {"is_active": True}
+    if category:
+        filter_query["category"] = category
+    if featured is not None:
+        filter_query["is_featured"] = featured
+    
+    if sort == "ranked":
+        ranked_ids = await ranking_engine.get_ranked_ids(db, current_user.id, filter_query)
+        page_ids = ranked_ids[offset:offset + limit]
+        polls = await db.polls.find({"id": {"$in": page_ids}}).to_list(len(page_ids))
+        polls_by_id = {poll["id"]: poll for poll in polls}
+        return await build_poll_responses(
+            [polls_by_id[poll_id] for poll_id in page_ids if poll_id in polls_by_id],
+            current_user, users
+        )
+    
+    # Get polls (cursor mode when a cursor is given, offset mode otherwise)
+    polls = await find_page(db.polls, filter_query, limit, offset, cursor, response)
+    
+    return await build_poll_responses(polls, current_user, users)
 
 @api_router.post("/polls", response_model=PollResponse)
 async def create_poll(
     poll_data: PollCreate,
+    background_tasks: BackgroundTasks,
     current_user: UserResponse = Depends(get_current_user)
 ):
     """Create a new poll"""
@@ -1816,27 +2293,15 @@ async def create_poll(
     # Insert into database
     await db.polls.insert_one(poll.dict())
     
+    # Push the poll into followers' home timelines after responding
+    background_tasks.add_task(fan_out_poll, db, poll.dict())
+    
     # Return poll response
-    options_response = []
-    for option in options:
-        option_dict = {
-            "id": option.id,
-            "text": option.text,
-            "votes": option.votes,
-            "user": {
-                "username": current_user.username,
-                "displayName": current_user.display_name,
-                "avatar": current_user.avatar_url,
-                "verified": current_user.is_verified,
-                "followers": "1K"  # Placeholder
-            },
-            "media": {
-                "type": option.media_type,
-                "url": option.media_url,
-                "thumbnail": option.thumbnail_url
-            } if option.media_url else None
-        }
-        options_response.append(option_dict)
+    author_data = current_user.dict()
+    followers_count = (await follow_graph.counts([current_user.id])).get(current_user.id, (0, 0))[0]
+    options_response = [
+        build_option_response(option.dict(), author_data, followers_count) for option in options
+    ]
     
     return PollResponse(
         id=poll.id,
@@ -1866,47 +2331,7 @@ async def vote_on_poll(
 ):
     """Vote on a poll"""
     
-    # Check if poll exists
-    poll = await db.polls.find_one({"id": poll_id, "is_active": True})
-    if not poll:
-        raise HTTPException(status_code=404, detail="Poll not found")
-    
-    # Check if user already voted
-    existing_vote = await db.votes.find_one({
-        "poll_id": poll_id,
-        "user_id": current_user.id
-    })
-    
-    if existing_vote:
-        # Update existing vote
-        # First, decrease vote count from previous option
-        await db.polls.update_one(
-            {"id": poll_id, "options.id": existing_vote["option_id"]},
-            {"$inc": {"options.$.votes": -1, "total_votes": -1}}
-        )
-        
-        # Update vote record
-        await db.votes.update_one(
-            {"id": existing_vote["id"]},
-            {"$set": {"option_id": vote_data.option_id}}
-        )
-    else:
-        # Create new vote
-        vote = Vote(
-            poll_id=poll_id,
-            option_id=vote_data.option_id,
-            user_id=current_user.id
-        )
-        await db.votes.insert_one(vote.dict())
-    
-    # Increment vote count for new option
-    result = await db.polls.update_one(
-        {"id": poll_id, "options.id": vote_data.option_id},
-        {"$inc": {"options.$.votes": 1, "total_votes": 1}}
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Invalid option ID")
+    await cast_vote(db, poll_id, current_user.id, vote_data.option_id, counter_buffer)
     
     return {"message": "Vote recorded successfully"}
 
@@ -1917,59 +2342,25 @@ async def toggle_poll_like(
 ):
     """Toggle like on a poll"""
     
-    # Check if poll exists
-    poll = await db.polls.find_one({"id": poll_id, "is_active": True})
-    if not poll:
-        raise HTTPException(status_code=404, detail="Poll not found")
+    like = PollLike(
+        poll_id=poll_id,
+        user_id=current_user.id
+    )
     
-    # Check if user already liked
-    existing_like = await db.poll_likes.find_one({
-        "poll_id": poll_id,
-        "user_id": current_user.id
-    })
+    # Add or remove the like and read the new count in one step
+    toggled = await toggle_counted_membership(
+        counter_buffer,
+        "poll_likes", like.dict(), {"poll_id": poll_id, "user_id": current_user.id},
+        "polls", {"id": poll_id, "is_active": True}, "likes"
+    )
+    if toggled is None:
+        raise HTTPException(status_code=404, detail="Poll not found")
     
-    if existing_like:
-        # Remove like
-        await db.poll_likes.delete_one({
-            "poll_id": poll_id,
-            "user_id": current_user.id
-        })
-        
-        # Decrement like count
-        await db.polls.update_one(
-            {"id": poll_id},
-            {"$inc": {"likes": -1}}
-        )
-        
-        # Get updated count
-        updated_poll = await db.polls.find_one({"id": poll_id})
-        
-        return {
-            "liked": False,
-            "likes": updated_poll["likes"]
-        }
-    else:
-        # Add like
-        like = PollLike(
-            poll_id=poll_id,
-            user_id=current_user.id
-        )
-        
-        await db.poll_likes.insert_one(like.dict())
-        
-        # Increment like count
-        await db.polls.update_one(
-            {"id": poll_id},
-            {"$inc": {"likes": 1}}
-        )
-        
-        # Get updated count
-        updated_poll = await db.polls.find_one({"id": poll_id})
-        
-        return {
-            "liked": True,
-            "likes": updated_poll["likes"]
-        }
+    liked, likes = toggled
+    return {
+        "liked": liked,
+        "likes": likes
+    }
 
 @api_router.post("/polls/{poll_id}/share")
 async def share_poll(
@@ -1978,22 +2369,11 @@ async def share_poll(
 ):
     """Increment share count for a poll"""
     
-    # Check if poll exists
-    poll = await db.polls.find_one({"id": poll_id, "is_active": True})
-    if not poll:
-        raise HTTPException(status_code=404, detail="Poll not found")
-    
-    # Increment share count
-    result = await db.polls.update_one(
-        {"id": poll_id},
-        {"$inc": {"shares": 1}}
+    updated_poll = await counter_buffer.increment_and_read(
+        "polls", {"id": poll_id, "is_active": True}, {"shares": 1}, ["shares"]
     )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=500, detail="Failed to update share count")
-    
-    # Get updated count
-    updated_poll = await db.polls.find_one({"id": poll_id})
+    if not updated_poll:
+        raise HTTPException(status_code=404, detail="Poll not found")
     
     return {
         "shares": updated_poll["shares"]
@@ -2002,7 +2382,8 @@ async def share_poll(
 @api_router.get("/polls/{poll_id}", response_model=PollResponse)
 async def get_poll_by_id(
     poll_id: str,
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader)
 ):
     """Get a specific poll by ID"""
     
@@ -2011,78 +2392,82 @@ async def get_poll_by_id(
     if not poll:
         raise HTTPException(status_code=404, detail="Poll not found")
     
-    # Get author info
-    author_data = await db.users.find_one({"id": poll["author_id"]})
-    if not author_data:
+    responses = await build_poll_responses([poll], current_user, users, skip_incomplete=False)
+    if not responses:
         raise HTTPException(status_code=404, detail="Author not found")
-    author = UserResponse(**author_data)
-    
-    # Get option users
-    option_user_ids = [option["user_id"] for option in poll.get("options", [])]
-    option_users_dict = {}
-    if option_user_ids:
-        option_users_cursor = db.users.find({"id": {"$in": option_user_ids}})
-        option_users_list = await option_users_cursor.to_list(len(option_user_ids))
-        option_users_dict = {user["id"]: user for user in option_users_list}
-    
-    # Get user vote and like
-    user_vote = await db.votes.find_one({
-        "poll_id": poll_id,
-        "user_id": current_user.id
-    })
-    
-    user_like = await db.poll_likes.find_one({
-        "poll_id": poll_id,
-        "user_id": current_user.id
-    })
     
-    # Process options
-    options = []
-    for option in poll.get("options", []):
-        option_user = option_users_dict.get(option["user_id"])
-        if option_user:
-            option_dict = {
-                "id": option["id"],
-                "text": option["text"],
-                "votes": option["votes"],
-                "user": {
-                    "username": option_user["username"],
-                    "displayName": option_user["display_name"],
-                    "avatar": option_user.get("avatar_url"),
-                    "verified": option_user.get("is_verified", False),
-                    "followers": "1K"  # Placeholder
-                },
-                "media": {
-                    "type": option.get("media_type"),
-                    "url": option.get("media_url"),
-                    "thumbnail": option.get("thumbnail_url")
-                } if option.get("media_url") else None
-            }
-            options.append(option_dict)
-    
-    return PollResponse(
-        id=poll["id"],
-        title=poll["title"],
-        author=author,
-        description=poll.get("description"),
-        options=options,
-        total_votes=poll["total_votes"],
-        likes=poll["likes"],
-        shares=poll["shares"],
-        comments_count=poll["comments_count"],
-        music=None,  # TODO: Implement music system
-        user_vote=user_vote["option_id"] if user_vote else None,
-        user_liked=bool(user_like),
-        is_featured=poll["is_featured"],
-        tags=poll.get("tags", []),
-        category=poll.get("category"),
-        created_at=poll["created_at"],
-        time_ago=calculate_time_ago(poll["created_at"])
-    )
+    return responses[0]
 
 # Add the API router to the main app
 app.include_router(api_router)
 
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    """Shed authentication load while the hashing pool is saturated"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Authentication service is busy. Please try again shortly."},
+        headers={"Retry-After": "1"}
+    )
+
+@app.on_event("startup")
+async def create_db_indexes():
+    """Make sure every hot query path is index-backed"""
+    if config.ENSURE_INDEXES_ON_STARTUP:
+        failures = await ensure_indexes(db)
+        if failures:
+            logger.warning(f"Index bootstrap finished with failures: {failures}")
+    # Like toggles and votes are only correct with their unique indexes
+    await check_required_indexes(db)
+
+@app.on_event("startup")
+async def start_counter_buffer():
+    """Start flushing buffered counters in the background"""
+    counter_buffer.start()
+
+@app.on_event("startup")
+async def start_pubsub():
+    """Start relaying real-time events from the pub/sub backend"""
+    await pubsub.start()
+
+@app.on_event("startup")
+async def start_comment_count_reconciler():
+    """Periodically repair drift in polls.comments_count"""
+    global comment_reconciler_task
+    if config.COMMENT_COUNT_RECONCILE_INTERVAL_SECONDS > 0:
+        comment_reconciler_task = asyncio.ensure_future(
+            run_reconciler(db, config.COMMENT_COUNT_RECONCILE_INTERVAL_SECONDS)
+        )
+
+@app.on_event("startup")
+async def start_suggestions_job():
+    """Periodically refresh stale follow suggestions"""
+    global suggestions_task
+    if config.SUGGESTIONS_JOB_INTERVAL_SECONDS > 0:
+        suggestions_task = asyncio.ensure_future(
+            follow_suggestions.run_periodically(db, config.SUGGESTIONS_JOB_INTERVAL_SECONDS)
+        )
+
+@app.on_event("startup")
+async def start_timeline_trimmer():
+    """Periodically cap home timelines at TIMELINE_MAX_ENTRIES"""
+    global timeline_trim_task
+    if config.TIMELINE_TRIM_INTERVAL_SECONDS > 0:
+        timeline_trim_task = asyncio.ensure_future(
+            run_trimmer(db, config.TIMELINE_TRIM_INTERVAL_SECONDS)
+        )
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    """Release worker pools and the database client"""
+    for task in (comment_reconciler_task, suggestions_task, timeline_trim_task):
+        if task is not None:
+            task.cancel()
+    await counter_buffer.stop()
+    await pubsub.stop()
+    password_hasher.shutdown()
+    client.close()
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -2090,6 +2475,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, BEFORE_CURSOR_HEADER, AFTER_CURSOR_HEADER],
 )
 
 if __name__ == "__main__":
@@ -0,0 +1,234 @@
+"""
+"Who to follow" suggestions computed in bulk over the follow graph.
+
+For a batch of users the job loads just the subgraph it needs (their
+follows, their followees' follows, their votes and the other voters on
+those polls) into NumPy CSR arrays and scores every candidate at once:
+
+- friends-of-friends: how many of the user's followees follow the candidate
+- co-voting: polls both voted on, each weighted by 1 / log(2 + voters) so
+  huge polls count for little
+
+The top ``SUGGESTIONS_TOP_K`` candidates are stored per user in
+``follow_suggestions`` and topped up with popular accounts when the graph
+has too little signal. Reads are one key lookup. Stored lists older than
+``SUGGESTIONS_MAX_AGE_SECONDS`` are recomputed, in the background when served
+or on the job's next pass.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pymongo import ReplaceOne
+
+from config import config
+from job_lock import acquire_lease
+
+logger = logging.getLogger(__name__)
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, n_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Compressed sparse rows: (indptr, column indices sorted by row)"""
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order]
+
+
+def _gather(indptr: np.ndarray, indices: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenated neighbours of ``rows`` and the row each one came from"""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=indices.dtype), np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return indices[offsets + np.arange(total)], np.repeat(np.arange(len(rows)), lengths)
+
+
+class _Ids:
+    """Dense local indices for user and poll ids"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.ids: List[str] = []
+
+    def get(self, key: str) -> int:
+        position = self.index.get(key)
+        if position is None:
+            position = self.index[key] = len(self.ids)
+            self.ids.append(key)
+        return position
+
+    def array(self, keys: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.get(key) for key in keys), dtype=np.int64)
+
+
+async def compute_suggestions(db, user_ids: List[str], popular: Optional[List[str]] = None) -> Dict[str, List[dict]]:
+    """Score candidates for a batch of users, returning the top K per user"""
+    top_k = config.SUGGESTIONS_TOP_K
+
+    # Subgraph: followees, their followees, votes and co-voters
+    first_hop = await db.follows.find(
+        {"follower_id": {"$in": user_ids}}, {"_id": 0, "follower_id": 1, "following_id": 1}
+    ).to_list(None)
+    followee_ids = list({follow["following_id"] for follow in first_hop})
+    second_hop = await db.follows.find(
+        {"follower_id": {"$in": followee_ids}}, {"_id": 0, "follower_id": 1, "following_id": 1}
+    ).to_list(None) if followee_ids else []
+
+    own_votes = await db.votes.find(
+        {"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "poll_id": 1}
+    ).to_list(None)
+    voted_poll_ids = list({vote["poll_id"] for vote in own_votes})
+    small_polls = [
+        poll["id"] for poll in await db.polls.find(
+            {"id": {"$in": voted_poll_ids}, "total_votes": {"$lte": config.SUGGESTIONS_MAX_POLL_VOTERS}},
+            {"_id": 0, "id": 1}
+        ).to_list(None)
+    ] if voted_poll_ids else []
+    co_votes = await db.votes.find(
+        {"poll_id": {"$in": small_polls}}, {"_id": 0, "user_id": 1, "poll_id": 1}
+    ).to_list(None) if small_polls else []
+
+    users = _Ids()
+    polls = _Ids()
+    targets = users.array(user_ids)
+    follows = {(f["follower_id"], f["following_id"]): f for f in first_hop + second_hop}.values()
+    follow_src = users.array(f["follower_id"] for f in follows)
+    follow_dst = users.array(f["following_id"] for f in follows)
+    votes = {(v["user_id"], v["poll_id"]): v for v in own_votes + co_votes}.values()
+    vote_user = users.array(v["user_id"] for v in votes)
+    vote_poll = polls.array(v["poll_id"] for v in votes)
+    popular_idx = users.array(popular or [])
+
+    n_users, n_polls = len(users.ids), len(polls.ids)
+    follow_ptr, follow_idx = _csr(follow_src, follow_dst, n_users)
+    user_poll_ptr, user_poll_idx = _csr(vote_user, vote_poll, n_users)
+    poll_user_ptr, poll_user_idx = _csr(vote_poll, vote_user, n_polls)
+    voters_per_poll = np.diff(poll_user_ptr)
+    poll_weight = 1.0 / np.log(2.0 + voters_per_poll)
+
+    results: Dict[str, List[dict]] = {}
+    for user_id, target in zip(user_ids, targets):
+        row = np.array([target])
+        followees, _ = _gather(follow_ptr, follow_idx, row)
+        fof, _ = _gather(follow_ptr, follow_idx, followees)
+        mutual = np.bincount(fof, minlength=n_users)
+
+        voted, _ = _gather(user_poll_ptr, user_poll_idx, row)
+        co_voters, source = _gather(poll_user_ptr, poll_user_idx, voted)
+        shared = np.bincount(co_voters, minlength=n_users)
+        affinity = np.bincount(co_voters, weights=poll_weight[voted][source], minlength=n_users)
+
+        scores = config.SUGGESTIONS_FOF_WEIGHT * mutual + config.SUGGESTIONS_COVOTE_WEIGHT * affinity
+        scores[target] = 0
+        scores[followees] = 0
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        suggestions = [
+            {
+                "user_id": users.ids[i],
+                "score": round(float(scores[i]), 4),
+                "mutual_follows": int(mutual[i]),
+                "shared_votes": int(shared[i]),
+                "reason": "mutual_follows" if mutual[i] else "shared_votes",
+            }
+            for i in candidates
+        ]
+
+        # Top up with popular accounts when the graph has too little signal
+        excluded = set(candidates.tolist()) | set(followees.tolist()) | {int(target)}
+        for i in popular_idx:
+            if len(suggestions) >= top_k:
+                break
+            if int(i) not in excluded:
+                suggestions.append({
+                    "user_id": users.ids[i], "score": 0.0, "mutual_follows": 0,
+                    "shared_votes": 0, "reason": "popular",
+                })
+        results[user_id] = suggestions
+    return results
+
+
+async def get_popular_user_ids(db, limit: int) -> List[str]:
+    """Most followed accounts, used to fill short suggestion lists"""
+    users = await db.users.find(
+        {"is_active": {"$ne": False}}, {"_id": 0, "id": 1}
+    ).sort("followers_count", -1).limit(limit).to_list(limit)
+    return [user["id"] for user in users]
+
+
+async def refresh_suggestions(db, user_ids: List[str], popular: Optional[List[str]] = None) -> int:
+    """Recompute and store suggestions for a batch of users"""
+    if not user_ids:
+        return 0
+    if popular is None:
+        popular = await get_popular_user_ids(db, config.SUGGESTIONS_TOP_K * 2)
+    suggestions = await compute_suggestions(db, user_ids, popular)
+    now = datetime.utcnow()
+    await db.follow_suggestions.bulk_write([
+        ReplaceOne(
+            {"user_id": user_id},
+            {"user_id": user_id, "suggestions": items, "computed_at": now},
+            upsert=True,
+        )
+        for user_id, items in suggestions.items()
+    ], ordered=False)
+    return len(suggestions)
+
+
+async def run_suggestions_job(db) -> int:
+    """Refresh every user whose suggestions are missing or past the staleness bound"""
+    stale_before = datetime.utcnow() - timedelta(seconds=config.SUGGESTIONS_MAX_AGE_SECONDS)
+    popular = await get_popular_user_ids(db, config.SUGGESTIONS_TOP_K * 2)
+    refreshed = 0
+    batch: List[str] = []
+    async for user in db.users.find({"is_active": {"$ne": False}}, {"_id": 0, "id": 1}):
+        batch.append(user["id"])
+        if len(batch) >= config.SUGGESTIONS_BATCH_SIZE:
+            refreshed += await _refresh_stale(db, batch, stale_before, popular)
+            batch = []
+    refreshed += await _refresh_stale(db, batch, stale_before, popular)
+    return refreshed
+
+
+async def _refresh_stale(db, user_ids: List[str], stale_before: datetime, popular: List[str]) -> int:
+    if not user_ids:
+        return 0
+    fresh = await db.follow_suggestions.find(
+        {"user_id": {"$in": user_ids}, "computed_at": {"$gte": stale_before}}, {"_id": 0, "user_id": 1}
+    ).to_list(len(user_ids))
+    fresh_ids = {doc["user_id"] for doc in fresh}
+    return await refresh_suggestions(db, [uid for uid in user_ids if uid not in fresh_ids], popular)
+
+
+async def run_periodically(db, interval: float) -> None:
+    """Run the suggestions job every ``interval`` seconds until cancelled.
+
+    Only the worker holding the ``follow_suggestions`` lease runs each pass.
+    """
+    while True:
+        try:
+            if await acquire_lease(db, "follow_suggestions", ttl=2 * interval):
+                refreshed = await run_suggestions_job(db)
+                if refreshed:
+                    logger.info(f"Refreshed follow suggestions for {refreshed} users")
+        except Exception as e:
+            logger.error(f"Follow suggestions job failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def get_suggestions(db, user_id: str) -> Tuple[Optional[dict], bool]:
+    """Stored suggestions of a user and whether they are past the staleness bound"""
+    doc = await db.follow_suggestions.find_one({"user_id": user_id}, {"_id": 0})
+    if doc is None:
+        return None, True
+    age = datetime.utcnow() - doc["computed_at"]
+    return doc, age.total_seconds() > config.SUGGESTIONS_MAX_AGE_SECONDS
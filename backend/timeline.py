@@ -0,0 +1,202 @@
+"""
+Materialized home timelines (fan-out-on-write).
+
+When a poll is created its id is pushed into the ``timelines`` collection of
+every follower, so reading the following feed is a single indexed range read
+on ``(user_id, created_at, id)``. Authors with more followers than
+``TIMELINE_CELEBRITY_THRESHOLD`` are flagged instead and their polls are
+merged into readers' pages at read time (fan-out-on-read).
+
+Timelines are capped at ``TIMELINE_MAX_ENTRIES``: on a reader's first page,
+after a follow copies in an author's polls, and by a periodic trim job for
+readers who never open their feed.
+"""
+import asyncio
+import logging
+from typing import List, Optional
+
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from cache import TTLCache
+from config import config
+from job_lock import acquire_lease
+from pagination import CURSOR_SORT, apply_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# user_id -> ids of followed authors whose polls are merged at read time
+_celebrity_followees = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=60)
+
+# user_ids whose timeline was trimmed recently
+_recently_trimmed = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.TIMELINE_TRIM_INTERVAL_SECONDS)
+
+
+def _timeline_entry(user_id: str, poll: dict) -> dict:
+    return {
+        "user_id": user_id,
+        "id": poll["id"],
+        "author_id": poll["author_id"],
+        "created_at": poll["created_at"],
+    }
+
+
+async def _insert_entries(db, entries: List[dict]) -> None:
+    if not entries:
+        return
+    try:
+        await db.timelines.bulk_write([InsertOne(entry) for entry in entries], ordered=False)
+    except BulkWriteError as e:
+        # Duplicate (user_id, id) pairs are expected when a fan-out is retried
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+
+async def fan_out_poll(db, poll: dict) -> int:
+    """Push a new poll into its author's and followers' timelines.
+
+    Returns the number of follower timelines written, or 0 when the author is
+    above the celebrity threshold and readers pull the poll instead.
+    """
+    author_id = poll["author_id"]
+    await _insert_entries(db, [_timeline_entry(author_id, poll)])
+
+    author = await db.users.find_one({"id": author_id}, {"_id": 0, "followers_count": 1})
+    follower_count = (author or {}).get("followers_count")
+    if follower_count is None:
+        # Author from before follow counts were stored
+        follower_count = await db.follows.count_documents(
+            {"following_id": author_id}, limit=config.TIMELINE_CELEBRITY_THRESHOLD + 1
+        )
+    if follower_count > config.TIMELINE_CELEBRITY_THRESHOLD:
+        await db.users.update_one({"id": author_id}, {"$set": {"fanout_on_read": True}})
+        return 0
+
+    written = 0
+    batch: List[dict] = []
+    async for follow in db.follows.find({"following_id": author_id}, {"follower_id": 1}):
+        batch.append(_timeline_entry(follow["follower_id"], poll))
+        if len(batch) >= config.TIMELINE_FANOUT_BATCH_SIZE:
+            await _insert_entries(db, batch)
+            written += len(batch)
+            batch = []
+    await _insert_entries(db, batch)
+    written += len(batch)
+    return written
+
+
+async def trim_timeline(db, user_id: str) -> None:
+    """Drop entries beyond the newest TIMELINE_MAX_ENTRIES for one user"""
+    boundary = await db.timelines.find(
+        {"user_id": user_id}, {"created_at": 1, "id": 1}
+    ).sort(CURSOR_SORT).skip(config.TIMELINE_MAX_ENTRIES).limit(1).to_list(1)
+    if boundary:
+        oldest_kept = boundary[0]
+        await db.timelines.delete_many({
+            "user_id": user_id,
+            "$or": [
+                {"created_at": {"$lt": oldest_kept["created_at"]}},
+                {"created_at": oldest_kept["created_at"], "id": {"$lte": oldest_kept["id"]}},
+            ],
+        })
+
+
+async def trim_all_timelines(db) -> int:
+    """Trim every timeline holding more than TIMELINE_MAX_ENTRIES entries"""
+    trimmed = 0
+    async for row in db.timelines.aggregate([
+        {"$group": {"_id": "$user_id", "entries": {"$sum": 1}}},
+        {"$match": {"entries": {"$gt": config.TIMELINE_MAX_ENTRIES}}},
+    ], allowDiskUse=True):
+        await trim_timeline(db, row["_id"])
+        trimmed += 1
+    return trimmed
+
+
+async def run_trimmer(db, interval: float) -> None:
+    """Trim oversized timelines every ``interval`` seconds until cancelled.
+
+    Fan-out writes do not trim, so timelines of users who never read their
+    feed are capped here. Only the holder of the ``timeline_trim`` lease
+    runs each pass.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await acquire_lease(db, "timeline_trim", ttl=2 * interval):
+                trimmed = await trim_all_timelines(db)
+                if trimmed:
+                    logger.info(f"Trimmed {trimmed} home timelines")
+        except Exception as e:
+            logger.error(f"Timeline trim failed: {e}")
+
+
+async def _get_celebrity_followees(db, user_id: str) -> List[str]:
+    cached = _celebrity_followees.get(user_id)
+    if cached is not None:
+        return cached
+    follows = await db.follows.find({"follower_id": user_id}, {"following_id": 1}).to_list(None)
+    followee_ids = [follow["following_id"] for follow in follows]
+    celebrities = []
+    if followee_ids:
+        celebrities = [
+            user["id"] for user in await db.users.find(
+                {"id": {"$in": followee_ids}, "fanout_on_read": True}, {"id": 1}
+            ).to_list(None)
+        ]
+    _celebrity_followees.set(user_id, celebrities)
+    return celebrities
+
+
+async def add_author_to_timeline(db, user_id: str, author_id: str) -> int:
+    """Copy an author's newest polls into a reader's timeline after a follow"""
+    polls = await db.polls.find(
+        {"author_id": author_id, "is_active": True}, {"_id": 0, "id": 1, "author_id": 1, "created_at": 1}
+    ).sort(CURSOR_SORT).limit(config.TIMELINE_FOLLOW_BACKFILL).to_list(config.TIMELINE_FOLLOW_BACKFILL)
+    await _insert_entries(db, [_timeline_entry(user_id, poll) for poll in polls])
+    if polls:
+        await trim_timeline(db, user_id)
+    return len(polls)
+
+
+async def remove_author_from_timeline(db, user_id: str, author_id: str) -> int:
+    """Drop an author's polls from a reader's timeline after an unfollow"""
+    result = await db.timelines.delete_many({"user_id": user_id, "author_id": author_id})
+    return result.deleted_count
+
+
+def invalidate_followees(user_id: str) -> None:
+    """Forget the cached celebrity followees after a follow/unfollow"""
+    _celebrity_followees.invalidate(user_id)
+
+
+async def read_timeline(db, user_id: str, limit: int, cursor: Optional[str]) -> tuple[List[dict], Optional[str]]:
+    """Read one page of a user's home timeline.
+
+    Returns the active poll documents in timeline order and the cursor of the
+    next page (None when there are no more entries).
+    """
+    if not cursor and not _recently_trimmed.get(user_id):
+        _recently_trimmed.set(user_id, True)
+        await trim_timeline(db, user_id)
+
+    entries = await db.timelines.find(
+        apply_cursor({"user_id": user_id}, cursor), {"_id": 0, "id": 1, "created_at": 1}
+    ).sort(CURSOR_SORT).limit(limit).to_list(limit)
+
+    # Pull polls from followed celebrities and merge them in
+    celebrity_ids = await _get_celebrity_followees(db, user_id)
+    if celebrity_ids:
+        pulled = await db.polls.find(
+            apply_cursor({"author_id": {"$in": celebrity_ids}, "is_active": True}, cursor),
+            {"_id": 0, "id": 1, "created_at": 1}
+        ).sort(CURSOR_SORT).limit(limit).to_list(limit)
+        merged = {entry["id"]: entry for entry in entries + pulled}
+        entries = sorted(merged.values(), key=lambda e: (e["created_at"], e["id"]), reverse=True)[:limit]
+
+    next_page = encode_cursor(entries[-1]) if len(entries) == limit else None
+
+    poll_ids = [entry["id"] for entry in entries]
+    polls = await db.polls.find({"id": {"$in": poll_ids}, "is_active": True}).to_list(len(poll_ids))
+    polls_by_id = {poll["id"]: poll for poll in polls}
+    return [polls_by_id[poll_id] for poll_id in poll_ids if poll_id in polls_by_id], next_page
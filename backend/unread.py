@@ -0,0 +1,74 @@
+"""
+Per-user aggregate unread message counter.
+
+The total number of unread messages of a user lives in one
+``unread_counters`` document, kept next to the per-conversation counts:
+``send_message`` adds one and advancing a read watermark subtracts the
+messages it covered. Reads are served from an in-process cache that every
+write on this worker refreshes, so the badge endpoint is a cache hit or a
+single key lookup.
+"""
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from cache import TTLCache
+
+
+class UnreadCounter:
+    """Cached per-user unread totals"""
+
+    def __init__(self, db, cache_size: int = 10000, ttl: float = 30):
+        self.db = db
+        self._cache = TTLCache(maxsize=cache_size, ttl=ttl)
+
+    async def _backfill(self, user_id: str) -> int:
+        """Create a missing counter from the per-conversation counts"""
+        total = 0
+        async for conversation in self.db.conversations.find(
+            {"participants": user_id, "is_active": True},
+            {"_id": 0, f"unread_count.{user_id}": 1}
+        ):
+            total += conversation.get("unread_count", {}).get(user_id, 0)
+        try:
+            counter = await self.db.unread_counters.find_one_and_update(
+                {"user_id": user_id},
+                {"$setOnInsert": {"count": total}},
+                upsert=True,
+                projection={"_id": 0, "count": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Another request created it first
+            counter = await self.db.unread_counters.find_one({"user_id": user_id}, {"_id": 0, "count": 1})
+        return counter["count"]
+
+    async def get(self, user_id: str) -> int:
+        """Total unread messages of a user"""
+        count: Optional[int] = self._cache.get(user_id)
+        if count is None:
+            counter = await self.db.unread_counters.find_one({"user_id": user_id}, {"_id": 0, "count": 1})
+            count = counter["count"] if counter else await self._backfill(user_id)
+            count = max(count, 0)
+            self._cache.set(user_id, count)
+        return count
+
+    async def change(self, user_id: str, delta: int) -> int:
+        """Atomically adjust a user's total and return the new value.
+
+        Call after the matching per-conversation count was updated, so a
+        missing counter is backfilled with this change already included.
+        """
+        counter = await self.db.unread_counters.find_one_and_update(
+            {"user_id": user_id},
+            {"$inc": {"count": delta}},
+            projection={"_id": 0, "count": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        count = max(counter["count"] if counter else await self._backfill(user_id), 0)
+        self._cache.set(user_id, count)
+        return count
+
+    def stats(self) -> dict:
+        return self._cache.stats()
@@ -0,0 +1,119 @@
+"""
+Indexed user search by normalized prefix keys.
+
+Each user stores ``username_key`` (the normalized username) and
+``search_keys`` (the normalized display-name words plus the whole name
+without spaces). Normalizing lowercases, strips accents and drops
+punctuation. These keys are written on register and on profile updates.
+A query is normalized the same way and matched with index range scans,
+never a regex, in three tiers:
+
+0. exact username
+1. username prefix
+2. display-name word or full-name prefix
+
+Within a tier users are ranked by follower count. The cursor encodes
+``(tier, followers_count, id)``, so pages continue exactly where the
+previous one stopped.
+"""
+import base64
+import json
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from loaders import USER_RESPONSE_PROJECTION
+
+TIER_EXACT_USERNAME = 0
+TIER_USERNAME_PREFIX = 1
+TIER_NAME_PREFIX = 2
+
+SEARCH_SORT = [("followers_count", -1), ("id", 1)]
+SEARCH_PROJECTION = {**USER_RESPONSE_PROJECTION, "followers_count": 1}
+
+# Letters and digits of any script survive, not only ASCII
+_NON_WORD = re.compile(r"[^\w.\s]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_NON_WORD.sub(" ", stripped.lower()).split())
+
+
+def search_fields(username: str, display_name: str) -> dict:
+    """Search keys to store on a user document"""
+    words = normalize(display_name).split()
+    keys = set(words)
+    if len(words) > 1:
+        keys.add("".join(words))
+    return {"username_key": normalize(username).replace(" ", ""), "search_keys": sorted(keys)}
+
+
+def _prefix_range(prefix: str) -> dict:
+    """Bounds matching every string that starts with ``prefix``"""
+    return {"$gte": prefix, "$lt": prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+
+def _tier_filter(tier: int, key: str) -> dict:
+    """Users whose best match for ``key`` is exactly ``tier``"""
+    if tier == TIER_EXACT_USERNAME:
+        return {"username_key": key}
+    if tier == TIER_USERNAME_PREFIX:
+        return {"username_key": {**_prefix_range(key), "$ne": key}}
+    return {
+        "search_keys": {"$elemMatch": _prefix_range(key)},
+        "username_key": {"$not": _prefix_range(key)},
+    }
+
+
+def _encode_cursor(tier: int, user: dict) -> str:
+    payload = {"t": tier, "f": user.get("followers_count", 0), "i": user["id"]}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[int, int, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(payload["t"]), int(payload["f"]), str(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def find_users(db, query: str, limit: int, cursor: Optional[str] = None,
+                     exclude_user_id: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """One ranked page of users matching ``query`` and the next cursor"""
+    key = normalize(query).replace(" ", "")
+    if not key:
+        return [], None
+
+    start_tier, after = TIER_EXACT_USERNAME, None
+    if cursor:
+        start_tier, followers_count, last_id = _decode_cursor(cursor)
+        after = {"$or": [
+            {"followers_count": {"$lt": followers_count}},
+            {"followers_count": followers_count, "id": {"$gt": last_id}},
+        ]}
+
+    ranked: List[Tuple[int, dict]] = []
+    for tier in range(start_tier, TIER_NAME_PREFIX + 1):
+        conditions = [_tier_filter(tier, key)]
+        if exclude_user_id:
+            conditions.append({"id": {"$ne": exclude_user_id}})
+        if after and tier == start_tier:
+            conditions.append(after)
+        remaining = limit - len(ranked)
+        users = await db.users.find(
+            {"$and": conditions}, SEARCH_PROJECTION
+        ).sort(SEARCH_SORT).limit(remaining).to_list(remaining)
+        ranked.extend((tier, user) for user in users)
+        if len(ranked) >= limit:
+            break
+
+    next_page = _encode_cursor(*ranked[-1]) if len(ranked) == limit else None
+    return [user for _, user in ranked], next_page
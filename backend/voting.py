@@ -0,0 +1,129 @@
+"""
+Atomic voting pipeline.
+
+A vote is two writes whatever the user's history on the poll:
+
+1. Upsert the ``(poll_id, user_id)`` vote document, which is unique, and get
+   its previous state back in the same round trip.
+2. Apply one conditional counter update to the poll, moving the vote from
+   the previous option to the new one.
+
+Each concurrent re-vote sees the exact option it replaced, because the
+upsert is atomic on the vote document. The counter deltas therefore always
+add up, even when the same user votes many times in parallel.
+"""
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from cache import TTLCache
+from counters import CounterBuffer, option_votes_field
+
+# poll_id -> option ids of an active poll, used to validate buffered votes
+_poll_options = TTLCache(maxsize=10000, ttl=300)
+
+
+async def _swap_vote(db, poll_id: str, user_id: str, option_id: str) -> Optional[dict]:
+    """Record the user's choice and return the vote it replaced, if any"""
+    for attempt in range(2):
+        try:
+            return await db.votes.find_one_and_update(
+                {"poll_id": poll_id, "user_id": user_id},
+                {
+                    "$set": {"option_id": option_id},
+                    "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": datetime.utcnow()},
+                },
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            # A concurrent first vote won the upsert race; retry as an update
+            if attempt:
+                raise
+
+
+async def _restore_vote(db, poll_id: str, user_id: str, option_id: str, previous: Optional[dict]) -> None:
+    """Undo _swap_vote after the counter update was rejected"""
+    if previous:
+        await db.votes.update_one(
+            {"poll_id": poll_id, "user_id": user_id, "option_id": option_id},
+            {"$set": {"option_id": previous["option_id"]}},
+        )
+    else:
+        await db.votes.delete_one({"poll_id": poll_id, "user_id": user_id, "option_id": option_id})
+
+
+async def _get_poll_options(db, poll_id: str) -> Optional[set]:
+    """Option ids of an active poll, or None if there is no such poll"""
+    option_ids = _poll_options.get(poll_id)
+    if option_ids is None:
+        poll = await db.polls.find_one({"id": poll_id, "is_active": True}, {"options.id": 1})
+        if not poll:
+            return None
+        option_ids = {option["id"] for option in poll.get("options", [])}
+        _poll_options.set(poll_id, option_ids)
+    return option_ids
+
+
+async def _cast_buffered_vote(db, poll_id: str, user_id: str, option_id: str,
+                              counters: CounterBuffer) -> Optional[str]:
+    option_ids = await _get_poll_options(db, poll_id)
+    if option_ids is None:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    if option_id not in option_ids:
+        raise HTTPException(status_code=400, detail="Invalid option ID")
+
+    previous = await _swap_vote(db, poll_id, user_id, option_id)
+    previous_option_id = previous["option_id"] if previous else None
+    if previous_option_id == option_id:
+        return previous_option_id
+
+    deltas = {option_votes_field(option_id): 1}
+    if previous_option_id:
+        deltas[option_votes_field(previous_option_id)] = -1
+    else:
+        deltas["total_votes"] = 1
+    counters.increment("polls", poll_id, deltas)
+    return previous_option_id
+
+
+async def cast_vote(db, poll_id: str, user_id: str, option_id: str,
+                    counters: Optional[CounterBuffer] = None) -> Optional[str]:
+    """Vote for ``option_id`` and return the previously voted option id.
+
+    With an enabled counter buffer the option is validated against a cached
+    copy of the poll's options and the counter change is written behind.
+    """
+    if counters is not None and counters.enabled:
+        return await _cast_buffered_vote(db, poll_id, user_id, option_id, counters)
+
+    previous = await _swap_vote(db, poll_id, user_id, option_id)
+    previous_option_id = previous["option_id"] if previous else None
+
+    if previous_option_id == option_id:
+        return previous_option_id
+
+    if previous_option_id:
+        update = {"$inc": {"options.$[new].votes": 1, "options.$[old].votes": -1}}
+        array_filters = [{"new.id": option_id}, {"old.id": previous_option_id}]
+    else:
+        update = {"$inc": {"options.$[new].votes": 1, "total_votes": 1}}
+        array_filters = [{"new.id": option_id}]
+
+    result = await db.polls.update_one(
+        {"id": poll_id, "is_active": True, "options.id": option_id},
+        update,
+        array_filters=array_filters,
+    )
+
+    if result.matched_count == 0:
+        await _restore_vote(db, poll_id, user_id, option_id, previous)
+        if not await db.polls.find_one({"id": poll_id, "is_active": True}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Poll not found")
+        raise HTTPException(status_code=400, detail="Invalid option ID")
+
+    return previous_option_id
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Comment Fetch Benchmark - Regression check for GET /api/comments/{id}
+Creates a comment with 100 replies and times fetching it with its replies.
+"""
+
+import requests
+import statistics
+import sys
+import time
+
+REPLY_COUNT = 100
+ITERATIONS = 20
+MAX_MEDIAN_MS = 250
+
+def get_backend_url():
+    """Get backend URL from frontend .env file"""
+    try:
+        with open('/app/frontend/.env', 'r') as f:
+            for line in f:
+                if line.startswith('REACT_APP_BACKEND_URL='):
+                    base_url = line.split('=', 1)[1].strip()
+                    return f"{base_url}/api"
+        return None
+    except Exception as e:
+        print(f"Error reading frontend .env file: {e}")
+        return None
+
+def register_user(base_url, name):
+    """Register a throwaway user and return its auth headers"""
+    timestamp = int(time.time() * 1000)
+    response = requests.post(f"{base_url}/auth/register", json={
+        "email": f"{name}.{timestamp}@example.com",
+        "username": f"{name}_{timestamp}",
+        "display_name": name.title(),
+        "password": "benchmark123"
+    }, timeout=10)
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_comment_with_100_replies(base_url):
+    """Fetch a comment with 100 replies and check the median latency"""
+    print(f"\n=== Benchmark: GET /comments/{{id}} with {REPLY_COUNT} replies ===")
+
+    author = register_user(base_url, "bench_author")
+    replier = register_user(base_url, "bench_replier")
+
+    poll = requests.post(f"{base_url}/polls", headers=author, json={
+        "title": "Benchmark poll for comment replies",
+        "options": [{"text": "Yes"}, {"text": "No"}]
+    }, timeout=10).json()
+
+    comment_url = f"{base_url}/polls/{poll['id']}/comments"
+    comment = requests.post(comment_url, headers=author, json={
+        "poll_id": poll["id"], "content": "Root comment"
+    }, timeout=10).json()
+
+    for i in range(REPLY_COUNT):
+        reply = requests.post(comment_url, headers=replier if i % 2 else author, json={
+            "poll_id": poll["id"], "content": f"Reply {i}", "parent_comment_id": comment["id"]
+        }, timeout=10)
+        reply.raise_for_status()
+        # Likes on half of the replies exercise the batched like lookup
+        if i % 2 == 0:
+            requests.post(f"{base_url}/comments/{reply.json()['id']}/like", headers=author, timeout=10)
+
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        response = requests.get(f"{base_url}/comments/{comment['id']}", headers=author, timeout=10)
+        timings.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+
+    data = response.json()
+    median_ms = statistics.median(timings)
+    print(f"Replies returned: {len(data['replies'])}")
+    print(f"Liked replies: {sum(1 for reply in data['replies'] if reply['user_liked'])}")
+    print(f"Median: {median_ms:.1f} ms, p95: {sorted(timings)[int(ITERATIONS * 0.95) - 1]:.1f} ms")
+
+    if len(data["replies"]) != REPLY_COUNT:
+        print(f"❌ Expected {REPLY_COUNT} replies")
+        return False
+    if median_ms > MAX_MEDIAN_MS:
+        print(f"❌ Median above {MAX_MEDIAN_MS} ms")
+        return False
+
+    print("✅ Comment fetch within budget")
+    return True
+
+def main():
+    base_url = get_backend_url()
+    if not base_url:
+        print("❌ Could not determine backend URL")
+        sys.exit(1)
+
+    print(f"Testing backend at: {base_url}")
+    sys.exit(0 if test_comment_with_100_replies(base_url) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Feed Hydration Benchmark - queries and latency per page of polls
+Seeds a separate database with polls whose options belong to different
+users, then hydrates pages of 20, 50 and 100 polls with
+build_poll_responses. Every command sent to MongoDB is counted through a
+pymongo command listener, so the script fails if the query count grows
+with the page size.
+
+Usage: python feed_benchmark.py [--drop]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+import server  # noqa: E402
+from loaders import UserLoader  # noqa: E402
+from models import Poll, PollOption, UserResponse  # noqa: E402
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'social_app') + '_feed_bench'
+
+PAGE_SIZES = [20, 50, 100]
+OPTIONS_PER_POLL = 4
+ITERATIONS = 20
+MAX_QUERIES_PER_PAGE = 6
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands sent to the server"""
+
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def bench_user(name, followers_count):
+    return {"id": str(uuid.uuid4()), "email": f"{name}@bench.example.com", "username": name,
+            "display_name": name.title(), "is_verified": False, "is_public": True, "allow_messages": True,
+            "created_at": datetime.utcnow(), "followers_count": followers_count, "following_count": 0}
+
+
+async def seed(db, poll_count):
+    await db.drop_collection("polls")
+    await db.drop_collection("users")
+    now = datetime.utcnow()
+    users, polls = [], []
+    for i in range(poll_count):
+        author = bench_user(f"author{i}", i)
+        users.append(author)
+        options = []
+        for j in range(OPTIONS_PER_POLL):
+            owner = bench_user(f"owner{i}_{j}", j)
+            users.append(owner)
+            options.append(PollOption(user_id=owner["id"], text=f"Option {j}", votes=j))
+        polls.append(Poll(
+            title=f"Benchmark poll {i}", author_id=author["id"], options=options,
+            total_votes=sum(range(OPTIONS_PER_POLL)), created_at=now - timedelta(minutes=i)
+        ).dict())
+    await db.users.insert_many(users)
+    await db.polls.insert_many(polls)
+    return {key: value for key, value in users[0].items() if key != "_id"}
+
+
+async def benchmark_page(db, counter, viewer, page_size):
+    polls = await db.polls.find({"is_active": True}).sort("created_at", -1).limit(page_size).to_list(page_size)
+    timings, query_counts = [], []
+    for _ in range(ITERATIONS):
+        # Fresh process caches, so every run measures a cold page
+        server.follow_graph = server.FollowGraph(db)
+        counter.commands.clear()
+        start = time.perf_counter()
+        responses = await server.build_poll_responses(polls, viewer, UserLoader(db))
+        timings.append((time.perf_counter() - start) * 1000)
+        query_counts.append(len(counter.commands))
+
+    queries = max(query_counts)
+    print(f"{page_size:4} polls: {len(responses):4} responses, {queries} queries, "
+          f"median {statistics.median(timings):7.2f} ms, max {max(timings):7.2f} ms")
+    return queries
+
+
+async def main():
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[counter])
+    db = client[db_name]
+    server.db = db
+    server.counter_buffer.db = db
+
+    viewer_doc = await seed(db, max(PAGE_SIZES))
+    viewer = UserResponse(**viewer_doc)
+
+    print(f"\n=== Benchmark: build_poll_responses, {OPTIONS_PER_POLL} options per poll ===")
+    queries = [await benchmark_page(db, counter, viewer, page_size) for page_size in PAGE_SIZES]
+
+    if "--drop" in sys.argv:
+        await client.drop_database(db_name)
+    client.close()
+
+    if len(set(queries)) != 1 or queries[0] > MAX_QUERIES_PER_PAGE:
+        print(f"❌ Query count depends on page size or exceeds {MAX_QUERIES_PER_PAGE}: {queries}")
+        sys.exit(1)
+    print("✅ Constant number of queries per page")
+
+if __name__ == "__main__":
+    asyncio.run(main())
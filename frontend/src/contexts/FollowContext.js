@@ -1,8 +1,11 @@
-import React, { createContext, useContext, useState } from 'react';
+import React, { createContext, useContext, useRef, useState } from 'react';
 import { useAuth } from './AuthContext';
 
 const FollowContext = createContext();
 
+// Page size for loading the full following list (server maximum is 1000)
+const FOLLOWING_PAGE_SIZE = 1000;
+
 export const useFollow = () => {
   const context = useContext(FollowContext);
   if (!context) {
@@ -15,6 +18,8 @@ export const FollowProvider = ({ children }) => {
   const { apiRequest } = useAuth();
   const [followingUsers, setFollowingUsers] = useState(new Map()); // userId -> isFollowing boolean
   const [userCache, setUserCache] = useState(new Map()); // username -> user object cache
+  const pendingStatusRef = useRef(new Map()); // userId -> [resolve] waiting for the next batch
+  const statusTimerRef = useRef(null);
 
   const getUserByUsername = async (username) => {
     try {
@@ -123,19 +128,58 @@ export const FollowProvider = ({ children }) => {
         }
       }
 
-      const response = await apiRequest(`/api/users/${userId}/follow-status`);
-      // Update local cache with both keys
+      // Calls made in the same tick are sent together to the batch endpoint
+      const isFollowingUser = await new Promise(resolve => {
+        const waiting = pendingStatusRef.current.get(userId) || [];
+        pendingStatusRef.current.set(userId, [...waiting, resolve]);
+        if (!statusTimerRef.current) {
+          statusTimerRef.current = setTimeout(flushFollowStatuses, 0);
+        }
+      });
+      if (originalKey !== userId) {
+        setFollowingUsers(prev => new Map(prev).set(originalKey, isFollowingUser));
+      }
+      return isFollowingUser;
+    } catch (error) {
+      console.error('Error getting follow status:', error);
+      return false;
+    }
+  };
+
+  const flushFollowStatuses = async () => {
+    const pending = pendingStatusRef.current;
+    pendingStatusRef.current = new Map();
+    statusTimerRef.current = null;
+
+    const statuses = await getFollowStatuses([...pending.keys()]);
+    pending.forEach((resolvers, userId) => {
+      resolvers.forEach(resolve => resolve(statuses[userId] || false));
+    });
+  };
+
+  // Follow status of many user IDs in a single request: { userId: isFollowing }
+  const getFollowStatuses = async (userIds) => {
+    const statuses = {};
+    try {
+      // The endpoint accepts up to 500 IDs per request
+      for (let start = 0; start < userIds.length; start += 500) {
+        const response = await apiRequest('/api/users/follow-status:batch', {
+          method: 'POST',
+          body: JSON.stringify({ user_ids: userIds.slice(start, start + 500) }),
+        });
+        Object.entries(response.statuses).forEach(([userId, status]) => {
+          statuses[userId] = status.is_following;
+        });
+      }
       setFollowingUsers(prev => {
         const newMap = new Map(prev);
-        newMap.set(userId, response.is_following);
-        newMap.set(originalKey, response.is_following);
+        Object.entries(statuses).forEach(([userId, following]) => newMap.set(userId, following));
         return newMap;
       });
-      return response.is_following;
     } catch (error) {
-      console.error('Error getting follow status:', error);
-      return false;
+      console.error('Error getting follow statuses:', error);
     }
+    return statuses;
   };
 
   const isFollowing = (userId) => {
@@ -144,14 +188,26 @@ export const FollowProvider = ({ children }) => {
 
   const getFollowingUsers = async () => {
     try {
-      const response = await apiRequest('/api/users/following');
+      // The list is paginated; follow the cursor until every page is loaded
+      const following = [];
+      let total = 0;
+      let cursor = null;
+      do {
+        const params = new URLSearchParams({ limit: String(FOLLOWING_PAGE_SIZE) });
+        if (cursor) params.set('cursor', cursor);
+        const page = await apiRequest(`/api/users/following?${params}`);
+        following.push(...page.following);
+        total = page.total;
+        cursor = page.next_cursor;
+      } while (cursor);
+
       // Update local cache
       const followingMap = new Map();
-      response.following.forEach(user => {
+      following.forEach(user => {
         followingMap.set(user.id, true);
       });
       setFollowingUsers(followingMap);
-      return response;
+      return { following, total };
     } catch (error) {
       console.error('Error getting following users:', error);
       return { following: [], total: 0 };
@@ -162,6 +218,7 @@ export const FollowProvider = ({ children }) => {
     followUser,
     unfollowUser,
     getFollowStatus,
+    getFollowStatuses,
     isFollowing,
     getFollowingUsers,
     getUserByUsername,
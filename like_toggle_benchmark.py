@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Like Toggle Benchmark - round trips and latency before and after user-011
+Compares the old find-then-write like toggle with toggle_counted_membership
+on a separate database. Every command sent to MongoDB is counted through a
+pymongo command listener; latency is reported as p50 and p99 over many
+like/unlike cycles, with counter buffering both off and on.
+
+Usage: python like_toggle_benchmark.py [--drop]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from counters import CounterBuffer, toggle_counted_membership  # noqa: E402
+from indexes import INDEX_SPECS  # noqa: E402
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'social_app') + '_like_bench'
+
+TOGGLES = 2000
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands sent to the server"""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def legacy_toggle(counters, poll_id, user_id):
+    """The toggle as it was before user-011: check, write, increment, re-read"""
+    db = counters.db
+    if not await db.polls.find_one({"id": poll_id, "is_active": True}):
+        return None
+    key = {"poll_id": poll_id, "user_id": user_id}
+    if await db.poll_likes.find_one(key):
+        await db.poll_likes.delete_one(key)
+        await counters.apply("polls", poll_id, {"likes": -1})
+        liked = False
+    else:
+        await db.poll_likes.insert_one({"id": str(uuid.uuid4()), **key})
+        await counters.apply("polls", poll_id, {"likes": 1})
+        liked = True
+    poll = await db.polls.find_one({"id": poll_id}, {"_id": 0, "id": 1, "likes": 1})
+    return liked, counters.merge("polls", poll)["likes"]
+
+
+async def current_toggle(counters, poll_id, user_id):
+    key = {"poll_id": poll_id, "user_id": user_id}
+    return await toggle_counted_membership(
+        counters, "poll_likes", {"id": str(uuid.uuid4()), **key}, key,
+        "polls", {"id": poll_id, "is_active": True}, "likes"
+    )
+
+
+async def run(db, counter, name, toggle, buffered):
+    poll_id = str(uuid.uuid4())
+    await db.polls.insert_one({"id": poll_id, "is_active": True, "likes": 0})
+    counters = CounterBuffer(db, enabled=buffered)
+    user_id = str(uuid.uuid4())
+
+    timings, like_trips, unlike_trips = [], [], []
+    for i in range(TOGGLES):
+        before = counter.count
+        start = time.perf_counter()
+        liked, _ = await toggle(counters, poll_id, user_id)
+        timings.append((time.perf_counter() - start) * 1000)
+        (like_trips if liked else unlike_trips).append(counter.count - before)
+    await counters.flush()
+
+    timings.sort()
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    mode = "buffered" if buffered else "direct"
+    print(f"  {name:7} {mode:8}  like {statistics.mean(like_trips):.1f} trips  "
+          f"unlike {statistics.mean(unlike_trips):.1f} trips  "
+          f"p50 {statistics.median(timings):6.2f} ms  p99 {p99:6.2f} ms")
+    final = await db.polls.find_one({"id": poll_id}, {"likes": 1})
+    return final["likes"] == 0
+
+
+async def main():
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[counter])
+    db = client[db_name]
+    await db.poll_likes.create_indexes(INDEX_SPECS["poll_likes"])
+    await db.polls.create_indexes(INDEX_SPECS["polls"])
+
+    print(f"\n=== Benchmark: {TOGGLES} like toggles on one poll ===")
+    ok = True
+    for buffered in (False, True):
+        ok &= await run(db, counter, "before", legacy_toggle, buffered)
+        ok &= await run(db, counter, "after", current_toggle, buffered)
+
+    if "--drop" in sys.argv:
+        await client.drop_database(db_name)
+    client.close()
+
+    if not ok:
+        print("❌ Like counts did not return to zero")
+        sys.exit(1)
+    print("✅ Like counts consistent")
+
+if __name__ == "__main__":
+    asyncio.run(main())
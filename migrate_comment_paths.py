@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Backfill materialized paths on existing comments.
+
+Sets ancestors, root_id, depth and reply_count on every comment from its
+parent_comment_id chain. Threads are processed one poll at a time and
+written with bulk updates. Safe to re-run.
+"""
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'social_app')
+
+BATCH_SIZE = 1000
+
+
+def compute_paths(comments):
+    """Map comment id -> path fields for the comments of one poll"""
+    parents = {comment["id"]: comment.get("parent_comment_id") for comment in comments}
+    reply_counts = {}
+    for parent_id in parents.values():
+        if parent_id:
+            reply_counts[parent_id] = reply_counts.get(parent_id, 0) + 1
+
+    ancestors_by_id = {}
+
+    def ancestors_of(comment_id):
+        # Iterative walk up the chain; stops at missing parents and cycles
+        chain = []
+        seen = {comment_id}
+        parent_id = parents.get(comment_id)
+        while parent_id and parent_id not in seen:
+            if parent_id in ancestors_by_id:
+                chain = ancestors_by_id[parent_id] + [parent_id] + chain
+                break
+            chain.insert(0, parent_id)
+            seen.add(parent_id)
+            parent_id = parents.get(parent_id)
+        ancestors_by_id[comment_id] = chain
+        return chain
+
+    paths = {}
+    for comment_id in parents:
+        ancestors = ancestors_of(comment_id)
+        paths[comment_id] = {
+            "ancestors": ancestors,
+            "root_id": ancestors[0] if ancestors else None,
+            "depth": len(ancestors),
+            "reply_count": reply_counts.get(comment_id, 0),
+        }
+    return paths
+
+
+async def migrate_comment_paths():
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    poll_ids = await db.comments.distinct("poll_id")
+    print(f"Migrating comments of {len(poll_ids)} polls...")
+
+    updated = 0
+    for poll_id in poll_ids:
+        comments = await db.comments.find(
+            {"poll_id": poll_id}, {"_id": 0, "id": 1, "parent_comment_id": 1}
+        ).to_list(None)
+        operations = [
+            UpdateOne({"id": comment_id}, {"$set": fields})
+            for comment_id, fields in compute_paths(comments).items()
+        ]
+        for start in range(0, len(operations), BATCH_SIZE):
+            result = await db.comments.bulk_write(operations[start:start + BATCH_SIZE], ordered=False)
+            updated += result.modified_count
+
+    await db.comments.create_index([("ancestors", 1), ("depth", 1)], name="ancestors_depth")
+    print(f"Updated {updated} comments")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_comment_paths())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Backfill pair_key on existing one-to-one conversations.
+
+send_message finds conversations by their sorted participant pair, so
+conversations created before that need the key. When a pair already has
+several conversations, only the most recently active one gets the key and
+the others are listed so they can be merged by hand. Safe to re-run.
+"""
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'social_app')
+
+BATCH_SIZE = 1000
+
+
+def pair_key(participants):
+    return ":".join(sorted(participants))
+
+
+async def migrate_conversation_pair_keys():
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    # Keys already taken, including by conversations created since the deploy
+    taken = set(await db.conversations.distinct("pair_key", {"pair_key": {"$type": "string"}}))
+
+    # Most recently active conversation first, so it wins its pair
+    newest_first = db.conversations.find(
+        {"pair_key": {"$not": {"$type": "string"}}, "participants": {"$size": 2}},
+        {"_id": 0, "id": 1, "participants": 1, "last_message_at": 1}
+    ).sort([("last_message_at", -1), ("created_at", -1)])
+
+    operations = []
+    duplicates = []
+    updated = 0
+    async for conversation in newest_first:
+        key = pair_key(conversation["participants"])
+        if key in taken:
+            duplicates.append(conversation["id"])
+            continue
+        taken.add(key)
+        operations.append(UpdateOne({"id": conversation["id"]}, {"$set": {"pair_key": key}}))
+        if len(operations) >= BATCH_SIZE:
+            updated += (await db.conversations.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        updated += (await db.conversations.bulk_write(operations, ordered=False)).modified_count
+
+    await db.conversations.create_index(
+        "pair_key", name="pair_key_unique", unique=True,
+        partialFilterExpression={"pair_key": {"$type": "string"}}
+    )
+
+    print(f"Set pair_key on {updated} conversations")
+    if duplicates:
+        print(f"{len(duplicates)} duplicate conversations left without a key:")
+        for conversation_id in duplicates:
+            print(f"  {conversation_id}")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_conversation_pair_keys())
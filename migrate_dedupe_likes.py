@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Remove duplicate likes and build the unique like indexes.
+
+Like toggles rely on unique (poll_id, user_id) and (comment_id, user_id)
+indexes, and the server refuses to start without them. The old
+find-then-insert code could store the same like twice, which makes building
+those indexes fail. This keeps the oldest like of every (target, user)
+pair, deletes the rest, recounts likes on the affected polls and comments
+and creates the indexes. Safe to re-run.
+"""
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'social_app')
+
+BATCH_SIZE = 1000
+
+# (like collection, target field, target collection, unique index name)
+LIKE_COLLECTIONS = [
+    ("poll_likes", "poll_id", "polls", "poll_id_user_id_unique"),
+    ("comment_likes", "comment_id", "comments", "comment_id_user_id_unique"),
+]
+
+
+async def dedupe(db, collection, target_field, target_collection, index_name):
+    duplicates = db[collection].aggregate([
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {
+            "_id": {"target": f"${target_field}", "user": "$user_id"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+
+    removed = 0
+    targets = set()
+    async for group in duplicates:
+        result = await db[collection].delete_many({"_id": {"$in": group["ids"][1:]}})
+        removed += result.deleted_count
+        targets.add(group["_id"]["target"])
+
+    # Recount likes on every target that had duplicates
+    operations = []
+    fixed = 0
+    for target_id in targets:
+        count = await db[collection].count_documents({target_field: target_id})
+        operations.append(UpdateOne({"id": target_id}, {"$set": {"likes": count}}))
+        if len(operations) >= BATCH_SIZE:
+            fixed += (await db[target_collection].bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        fixed += (await db[target_collection].bulk_write(operations, ordered=False)).modified_count
+
+    await db[collection].create_index(
+        [(target_field, 1), ("user_id", 1)], name=index_name, unique=True
+    )
+    print(f"{collection}: removed {removed} duplicate likes, recounted {fixed} {target_collection}")
+
+
+async def migrate_dedupe_likes():
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    for collection, target_field, target_collection, index_name in LIKE_COLLECTIONS:
+        await dedupe(db, collection, target_field, target_collection, index_name)
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_dedupe_likes())
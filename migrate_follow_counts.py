@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Backfill followers_count and following_count on existing users.
+
+Feeds and follow lists read the stored counts through the user lookup,
+so users created before the counts were stored need them filled in. Each
+batch is counted with two aggregations over follows. Only fields that are
+still missing are set, the same way FollowGraph backfills them on demand,
+so the script is safe to run while the app is serving and to re-run.
+"""
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'social_app')
+
+BATCH_SIZE = 1000
+COUNT_FIELDS = {"followers_count": "following_id", "following_count": "follower_id"}
+
+
+async def count_edges(db, field, user_ids):
+    pipeline = [
+        {"$match": {field: {"$in": user_ids}}},
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+    ]
+    return {row["_id"]: row["count"] async for row in db.follows.aggregate(pipeline)}
+
+
+async def backfill_batch(db, user_ids):
+    operations = []
+    for count_field, edge_field in COUNT_FIELDS.items():
+        counts = await count_edges(db, edge_field, user_ids)
+        operations.extend(
+            UpdateOne({"id": user_id, count_field: {"$exists": False}},
+                      {"$set": {count_field: counts.get(user_id, 0)}})
+            for user_id in user_ids
+        )
+    return (await db.users.bulk_write(operations, ordered=False)).modified_count
+
+
+async def migrate_follow_counts():
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    missing = db.users.find(
+        {"$or": [{field: {"$exists": False}} for field in COUNT_FIELDS]},
+        {"_id": 0, "id": 1}
+    )
+
+    batch = []
+    updated = 0
+    async for user in missing:
+        batch.append(user["id"])
+        if len(batch) >= BATCH_SIZE:
+            updated += await backfill_batch(db, batch)
+            batch = []
+    if batch:
+        updated += await backfill_batch(db, batch)
+
+    print(f"Set follow counts on {updated} fields")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_follow_counts())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Backfill the user search keys on existing users.
+
+/users/search matches normalized prefix keys instead of a regex, so users
+registered before that need username_key and search_keys. Users without
+stored follow counts get them too, since results are ranked by
+followers_count. Safe to re-run.
+"""
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from user_search import search_fields  # noqa: E402
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'social_app')
+
+BATCH_SIZE = 1000
+
+
+async def count_follows(db, field):
+    counts = {}
+    async for row in db.follows.aggregate([{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+    return counts
+
+
+async def migrate_user_search_keys():
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    followers = await count_follows(db, "following_id")
+    following = await count_follows(db, "follower_id")
+
+    operations = []
+    updated = 0
+    async for user in db.users.find(
+        {}, {"_id": 0, "id": 1, "username": 1, "display_name": 1, "followers_count": 1, "following_count": 1}
+    ):
+        fields = search_fields(user["username"], user.get("display_name", ""))
+        if "followers_count" not in user or "following_count" not in user:
+            fields["followers_count"] = followers.get(user["id"], 0)
+            fields["following_count"] = following.get(user["id"], 0)
+        operations.append(UpdateOne({"id": user["id"]}, {"$set": fields}))
+        if len(operations) >= BATCH_SIZE:
+            updated += (await db.users.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        updated += (await db.users.bulk_write(operations, ordered=False)).modified_count
+
+    await db.users.create_index(
+        [("username_key", 1), ("followers_count", -1), ("id", 1)], name="username_key_followers"
+    )
+    await db.users.create_index(
+        [("search_keys", 1), ("followers_count", -1), ("id", 1)], name="search_keys_followers"
+    )
+
+    print(f"Updated search keys on {updated} users")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_user_search_keys())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Ranked Feed Benchmark - scoring throughput of the ranking engine
+Builds synthetic candidate batches of 10k and 100k polls and times feature
+extraction, scoring and sorting separately. No database is needed.
+
+Usage: python ranking_benchmark.py
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from ranking import RankingEngine  # noqa: E402
+
+CANDIDATE_COUNTS = [10_000, 100_000]
+ITERATIONS = 10
+AUTHOR_COUNT = 5000
+FOLLOWED_COUNT = 300
+MAX_RANK_MS_PER_10K = 50
+
+
+def synthetic_candidates(count, now):
+    authors = [str(uuid.uuid4()) for _ in range(AUTHOR_COUNT)]
+    polls = [
+        {
+            "id": str(uuid.uuid4()),
+            "author_id": random.choice(authors),
+            "created_at": now - timedelta(minutes=random.randint(0, 14 * 24 * 60)),
+            "likes": random.randint(0, 500),
+            "shares": random.randint(0, 50),
+            "comments_count": random.randint(0, 200),
+            "total_votes": random.randint(0, 5000),
+            "is_featured": random.random() < 0.01,
+        }
+        for _ in range(count)
+    ]
+    return polls, set(random.sample(authors, FOLLOWED_COUNT))
+
+
+def timed(fn):
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings), max(timings)
+
+
+def benchmark(engine, count):
+    now = datetime.utcnow()
+    polls, followed_ids = synthetic_candidates(count, now)
+
+    batch, build_ms, build_max = timed(lambda: engine.build_batch(polls, followed_ids, now))
+    _, score_ms, score_max = timed(lambda: engine.score(batch))
+    ranked, rank_ms, rank_max = timed(lambda: engine.rank(batch))
+
+    print(f"{count:>7} candidates:")
+    print(f"  build_batch  median {build_ms:8.2f} ms  max {build_max:8.2f} ms")
+    print(f"  score        median {score_ms:8.2f} ms  max {score_max:8.2f} ms")
+    print(f"  rank         median {rank_ms:8.2f} ms  max {rank_max:8.2f} ms  "
+          f"({count / (rank_ms / 1000):,.0f} candidates/s)")
+    return len(ranked) == count and rank_ms <= MAX_RANK_MS_PER_10K * count / 10_000
+
+
+def main():
+    random.seed(42)
+    engine = RankingEngine()
+    print("=== Benchmark: ranked feed scoring ===")
+    results = [benchmark(engine, count) for count in CANDIDATE_COUNTS]
+    if not all(results):
+        print(f"❌ Ranking slower than {MAX_RANK_MS_PER_10K} ms per 10k candidates")
+        sys.exit(1)
+    print("✅ Ranking within budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Real-time Events Test - GET /api/ws with the in-memory pub/sub backend
+Runs the app in-process with FastAPI's TestClient against a separate test
+database. One user opens the WebSocket and another sends them a message;
+the socket must deliver message.new followed by unread.count. Also checks
+that ping is answered and that a bad token is rejected.
+"""
+
+import os
+import sys
+import time
+
+# Separate database and the in-process backend, set before the app is imported
+os.environ["DB_NAME"] = os.environ.get("DB_NAME", "social_media_app") + "_ws_test"
+os.environ["PUBSUB_BACKEND"] = "memory"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from starlette.websockets import WebSocketDisconnect  # noqa: E402
+
+import server  # noqa: E402
+from realtime import MESSAGE_NEW, UNREAD_COUNT, user_channel  # noqa: E402
+
+def register_user(client, name):
+    """Register a throwaway user and return (user id, access token)"""
+    timestamp = int(time.time() * 1000)
+    response = client.post("/api/auth/register", json={
+        "email": f"{name}.{timestamp}@example.com",
+        "username": f"{name}_{timestamp}",
+        "display_name": name.title(),
+        "password": "websocket123"
+    })
+    response.raise_for_status()
+    data = response.json()
+    return data["user"]["id"], data["access_token"]
+
+def receive_until(websocket, event_type, max_events=10):
+    """Read events until one of ``event_type`` arrives"""
+    for _ in range(max_events):
+        event = websocket.receive_json()
+        if event.get("type") == event_type:
+            return event
+    return None
+
+def test_message_events(client):
+    """A message sent over HTTP reaches the recipient's socket"""
+    print("\n=== Testing message.new and unread.count over /api/ws ===")
+    recipient_id, recipient_token = register_user(client, "ws_recipient")
+    _, sender_token = register_user(client, "ws_sender")
+
+    with client.websocket_connect(f"/api/ws?token={recipient_token}") as websocket:
+        websocket.send_json({"type": "ping"})
+        if receive_until(websocket, "pong") is None:
+            print("❌ No pong received")
+            return False
+
+        response = client.post("/api/messages", headers={"Authorization": f"Bearer {sender_token}"}, json={
+            "recipient_id": recipient_id, "content": "Hello over WebSocket"
+        })
+        response.raise_for_status()
+
+        message_event = receive_until(websocket, MESSAGE_NEW)
+        unread_event = receive_until(websocket, UNREAD_COUNT)
+
+    print(f"message.new: {message_event}")
+    print(f"unread.count: {unread_event}")
+    if not message_event or message_event["data"]["content"] != "Hello over WebSocket":
+        print("❌ message.new not delivered")
+        return False
+    if not unread_event or unread_event["data"]["unread_count"] != 1:
+        print("❌ unread.count not delivered")
+        return False
+    # The server unsubscribes once it sees the close, shortly after the client
+    for _ in range(50):
+        if not server.pubsub.is_subscribed(user_channel(recipient_id)):
+            break
+        time.sleep(0.02)
+    else:
+        print("❌ Subscription left open after disconnect")
+        return False
+
+    print("✅ Events delivered over WebSocket")
+    return True
+
+def test_rejects_bad_token(client):
+    """A socket with an invalid token is closed before it is accepted"""
+    print("\n=== Testing /api/ws with an invalid token ===")
+    try:
+        with client.websocket_connect("/api/ws?token=invalid") as websocket:
+            websocket.receive_json()
+    except WebSocketDisconnect as e:
+        print(f"Closed with code {e.code}")
+        if e.code == 1008:
+            print("✅ Invalid token rejected")
+            return True
+    print("❌ Invalid token was not rejected")
+    return False
+
+def main():
+    with TestClient(server.app) as client:
+        try:
+            results = [test_message_events(client), test_rejects_bad_token(client)]
+        finally:
+            server.client.drop_database(os.environ["DB_NAME"])
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
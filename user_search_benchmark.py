@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+User Search Benchmark - indexed prefix keys vs the old unanchored $regex
+Seeds a separate database with synthetic users (1,000,000 by default) and
+times the search queries against it. For each query the index used and the
+number of documents examined are printed next to the latency.
+
+Usage: python user_search_benchmark.py [user_count]
+The benchmark database is left in place so it can be re-run; pass --drop
+to remove it at the end.
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import string
+import sys
+import time
+import uuid
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from indexes import INDEX_SPECS  # noqa: E402
+from user_search import SEARCH_PROJECTION, find_users, normalize, search_fields  # noqa: E402
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'social_app') + '_search_bench'
+
+USER_COUNT = 1_000_000
+BATCH_SIZE = 10_000
+ITERATIONS = 20
+PAGE_SIZE = 10
+QUERIES = ["ana", "maria", "jo", "garcia", "lopez", "ana_garcia", "иван", "王", "zz", "x"]
+
+FIRST_NAMES = ["Ana", "María", "José", "Juan", "Lucía", "Pedro", "Sofía", "Jorge", "Elena", "Carlos",
+               "Laura", "Diego", "Valentina", "Andrés", "Camila", "Joaquín", "Isabel", "Mateo", "Иван", "Ли"]
+LAST_NAMES = ["García", "López", "Martínez", "Rodríguez", "Pérez", "Sánchez", "Gómez", "Fernández",
+              "Díaz", "Torres", "Ramírez", "Flores", "Rivera", "Morales", "Ortiz", "Castro", "Петров", "王"]
+
+
+def synthetic_user(n):
+    first, last = random.choice(FIRST_NAMES), random.choice(LAST_NAMES)
+    suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=4))
+    username = f"{normalize(first)}_{normalize(last)}{n}{suffix}"
+    display_name = f"{first} {last}"
+    return {
+        "id": str(uuid.uuid4()),
+        "email": f"{username}@bench.example.com",
+        "username": username,
+        "display_name": display_name,
+        "is_active": True,
+        # Long tail: most users have few followers
+        "followers_count": int(random.paretovariate(1.2)) - 1,
+        "following_count": random.randint(0, 300),
+        **search_fields(username, display_name),
+    }
+
+
+async def seed(db, count):
+    existing = await db.users.estimated_document_count()
+    if existing >= count:
+        print(f"Reusing {existing} users in {db_name}")
+        return
+    print(f"Seeding {count - existing} users into {db_name}...")
+    start = time.perf_counter()
+    for offset in range(existing, count, BATCH_SIZE):
+        batch = [synthetic_user(n) for n in range(offset, min(offset + BATCH_SIZE, count))]
+        await db.users.insert_many(batch, ordered=False)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+    await db.users.create_indexes(INDEX_SPECS["users"])
+
+
+def plan_summary(explain):
+    stats = explain.get("executionStats", {})
+    stages = []
+
+    def walk(stage):
+        if not stage:
+            return
+        if stage.get("indexName"):
+            stages.append(stage["indexName"])
+        walk(stage.get("inputStage"))
+        for child in stage.get("inputStages", []):
+            walk(child)
+
+    walk(stats.get("executionStages"))
+    index = ", ".join(dict.fromkeys(stages)) or "COLLSCAN"
+    return f"index={index} docsExamined={stats.get('totalDocsExamined')}"
+
+
+async def time_it(coro_factory):
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        await coro_factory()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+async def benchmark_query(db, q):
+    async def indexed():
+        return await find_users(db, q, PAGE_SIZE)
+
+    regex = {"$regex": q, "$options": "i"}
+    regex_filter = {"$or": [{"username": regex}, {"display_name": regex}]}
+
+    async def unanchored():
+        return await db.users.find(regex_filter, SEARCH_PROJECTION).limit(PAGE_SIZE).to_list(PAGE_SIZE)
+
+    users, cursor = await indexed()
+    median, worst = await time_it(indexed)
+    print(f"  prefix keys  q={q!r:10} median={median:7.2f}ms max={worst:7.2f}ms results={len(users)}")
+
+    # Plan of the widest tier (display-name prefix) on its own
+    key = normalize(q).replace(" ", "")
+    upper = key[:-1] + chr(ord(key[-1]) + 1)
+    tier_filter = {"search_keys": {"$elemMatch": {"$gte": key, "$lt": upper}}}
+    explain = await db.command({
+        "explain": {"find": "users", "filter": tier_filter, "sort": {"followers_count": -1, "id": 1},
+                    "limit": PAGE_SIZE},
+        "verbosity": "executionStats",
+    })
+    print(f"               {plan_summary(explain)}")
+
+    if cursor:
+        async def second_page():
+            return await find_users(db, q, PAGE_SIZE, cursor)
+        median, worst = await time_it(second_page)
+        print(f"  next page    q={q!r:10} median={median:7.2f}ms max={worst:7.2f}ms")
+
+    median, worst = await time_it(unanchored)
+    explain = await db.command({
+        "explain": {"find": "users", "filter": regex_filter, "limit": PAGE_SIZE},
+        "verbosity": "executionStats",
+    })
+    print(f"  old $regex   q={q!r:10} median={median:7.2f}ms max={worst:7.2f}ms")
+    print(f"               {plan_summary(explain)}")
+
+
+async def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    count = int(args[0]) if args else USER_COUNT
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    await seed(db, count)
+    print(f"\nSearching {await db.users.estimated_document_count()} users, {ITERATIONS} runs per query\n")
+    for q in QUERIES:
+        await benchmark_query(db, q)
+
+    if "--drop" in sys.argv:
+        await client.drop_database(db_name)
+        print(f"\nDropped {db_name}")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
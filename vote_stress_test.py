@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Vote Concurrency Stress Test - Regression check for POST /api/polls/{id}/vote
+Registers a pool of voters and fires thousands of parallel votes and
+re-votes at one poll. Afterwards every option's count must equal the number
+of voters whose current vote is that option, and total_votes must equal the
+number of voters.
+"""
+
+import random
+import requests
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+VOTER_COUNT = 200
+VOTES_PER_VOTER = 15
+OPTION_COUNT = 4
+WORKERS = 64
+# Buffered counters are written behind; give the flush loop time to run
+FLUSH_WAIT_SECONDS = 3
+
+def get_backend_url():
+    """Get backend URL from frontend .env file"""
+    try:
+        with open('/app/frontend/.env', 'r') as f:
+            for line in f:
+                if line.startswith('REACT_APP_BACKEND_URL='):
+                    base_url = line.split('=', 1)[1].strip()
+                    return f"{base_url}/api"
+        return None
+    except Exception as e:
+        print(f"Error reading frontend .env file: {e}")
+        return None
+
+def register_user(base_url, name):
+    """Register a throwaway user and return its auth headers"""
+    timestamp = int(time.time() * 1000)
+    response = requests.post(f"{base_url}/auth/register", json={
+        "email": f"{name}.{timestamp}@example.com",
+        "username": f"{name}_{timestamp}",
+        "display_name": name.title(),
+        "password": "stresstest123"
+    }, timeout=10)
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_parallel_votes(base_url):
+    """Hammer one poll with parallel votes and check the counts add up"""
+    total = VOTER_COUNT * VOTES_PER_VOTER
+    print(f"\n=== Stress: {total} parallel votes from {VOTER_COUNT} voters ===")
+
+    author = register_user(base_url, "stress_author")
+    poll = requests.post(f"{base_url}/polls", headers=author, json={
+        "title": "Vote stress test poll",
+        "options": [{"text": f"Option {i}"} for i in range(OPTION_COUNT)]
+    }, timeout=10).json()
+    option_ids = [option["id"] for option in poll["options"]]
+    vote_url = f"{base_url}/polls/{poll['id']}/vote"
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        voters = list(pool.map(lambda i: register_user(base_url, f"stress_voter{i}"), range(VOTER_COUNT)))
+
+        # Every voter votes and re-votes many times, interleaved with everyone else
+        votes = [voter for voter in voters for _ in range(VOTES_PER_VOTER)]
+        random.shuffle(votes)
+        start = time.perf_counter()
+        statuses = list(pool.map(
+            lambda voter: requests.post(vote_url, headers=voter, json={
+                "option_id": random.choice(option_ids)
+            }, timeout=30).status_code,
+            votes
+        ))
+        elapsed = time.perf_counter() - start
+
+    failed = sum(1 for status in statuses if status != 200)
+    print(f"Sent {total} votes in {elapsed:.1f}s ({total / elapsed:.0f} votes/s), {failed} failed")
+
+    time.sleep(FLUSH_WAIT_SECONDS)
+
+    # Each voter's current choice, as the server sees it
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        choices = Counter(pool.map(
+            lambda voter: requests.get(f"{base_url}/polls/{poll['id']}", headers=voter, timeout=10).json()["user_vote"],
+            voters
+        ))
+    final = requests.get(f"{base_url}/polls/{poll['id']}", headers=author, timeout=10).json()
+    counts = {option["id"]: option["votes"] for option in final["options"]}
+
+    print(f"total_votes: {final['total_votes']} (expected {VOTER_COUNT})")
+    for option_id in option_ids:
+        print(f"  option {option_id[:8]}: {counts[option_id]} votes, {choices[option_id]} voters")
+
+    ok = failed == 0 and final["total_votes"] == VOTER_COUNT and all(
+        counts[option_id] == choices[option_id] for option_id in option_ids
+    ) and sum(counts.values()) == VOTER_COUNT
+    if not ok:
+        print("❌ Vote counts drifted from the stored votes")
+        return False
+
+    print("✅ Vote counts consistent under parallel load")
+    return True
+
+def main():
+    base_url = get_backend_url()
+    if not base_url:
+        print("❌ Could not determine backend URL")
+        sys.exit(1)
+
+    print(f"Testing backend at: {base_url}")
+    sys.exit(0 if test_parallel_votes(base_url) else 1)
+
+if __name__ == "__main__":
+    main()